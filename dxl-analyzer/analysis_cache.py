@@ -0,0 +1,125 @@
+#!/bin/env python
+
+# standard imports
+import os
+import array
+import collections
+import cPickle as pickle
+
+# custom imports
+from dxl_lexer import Lexer
+
+# Version of the summaries, to change whenever the lexer or the content
+# of Summary changes so that the summaries of the previous scans are
+# computed again
+VERSION = 2
+
+# Arrays of the Lexer.TokenTable of the content kept by Summary
+TOKEN_ARRAYS = ("types","starts","ends","lines","columns","line_index")
+
+
+class Summary:
+    """
+        What the checks of dxl_scan.py use from the Lexer.Analysis of a DXL
+        content, whose SHA-1 is content_hash: the tokens of interest found by
+        the lexer, the number of lines holding tokens, the
+        dup_finder.Fingerprints of the content and the token table the HTML
+        version is rendered from, given back by analysis()
+
+        Dictionnaries keep the order of the ones of the analysis, that
+        unpickled dictionnaries may not, so that the checks report the
+        same whether the content is lexed or found in the cache.
+    """
+
+    def __init__(self,content_hash,analysis,fingerprints):
+        self.content_hash = content_hash
+        self.include_dict = collections.OrderedDict(analysis.include_dict.items())
+        self.string_init_dict = collections.OrderedDict(analysis.string_init_dict.items())
+        self.string_init_loop_dict = collections.OrderedDict(analysis.string_init_loop_dict.items())
+        self.pragma_dict = collections.OrderedDict(analysis.pragma_dict.items())
+        self.sys_call_dict = collections.OrderedDict(analysis.sys_call_dict.items())
+        self.func_called = analysis.func_called
+        self.func_declarations_dict = collections.OrderedDict(analysis.func_declarations_dict.items())
+        self.is_exec_by_doors = analysis.is_exec_by_doors
+        self.nb_lines = analysis.nb_lines
+        self.nb_code_lines = len(analysis.tokens.line_numbers())
+        self.fingerprints = fingerprints
+        self.size = analysis.size
+        self.token_arrays = [(name,getattr(analysis.tokens,name).tostring()) for name in TOKEN_ARRAYS]
+
+    def analysis(self,dxl_file):
+        """
+            Returns the Lexer.Analysis of the content, token values read
+            from dxl_file until analysis.tokens.close()
+        """
+
+        analysis = Lexer.Analysis(dxl_file=dxl_file)
+        for name in ["include_dict","string_init_dict","string_init_loop_dict","pragma_dict","sys_call_dict",
+                     "func_called","func_declarations_dict","is_exec_by_doors","nb_lines","size"]:
+            setattr(analysis,name,getattr(self,name))
+        for name, values in self.token_arrays:
+            token_array = array.array(getattr(analysis.tokens,name).typecode)
+            token_array.fromstring(values)
+            setattr(analysis.tokens,name,token_array)
+        return analysis
+
+
+class AnalysisCache:
+    """
+        Summaries of the DXL contents analysed by the previous scans, kept
+        in directory by content hash, so that unchanged files and includes
+        are not lexed again
+
+        Each summary is a file written once by any process, so that the
+        --jobs workers and the shards read and write the cache at the same
+        time. Summaries of another version of the analysis are ignored.
+    """
+
+    def __init__(self,directory,version):
+        self.__directory = directory
+        self.__version = version
+
+    def __path(self,content_hash):
+        return os.path.join(self.__directory,content_hash[:2],content_hash)
+
+    def get(self,content_hash):
+        """
+            Returns the Summary of the content, None if not in the cache
+        """
+
+        try:
+            with open(self.__path(content_hash),"rb") as f:
+                version, summary = pickle.load(f)
+        except Exception:
+            # not in the cache, or written by an older version of the code
+            return None
+
+        if version != self.__version:
+            return None
+        return summary
+
+    def put(self,summary):
+        """
+            Adds a Summary to the cache
+        """
+
+        path = self.__path(summary.content_hash)
+        try:
+            os.mkdir(os.path.dirname(path))
+        except OSError:
+            if not os.path.isdir(os.path.dirname(path)):
+                raise
+
+        # written aside then renamed, so that a summary is read complete
+        tmp_path = "%s.%d.tmp" % (path,os.getpid())
+        with open(tmp_path,"wb") as f:
+            pickle.dump((self.__version,summary),f,pickle.HIGHEST_PROTOCOL)
+        try:
+            os.rename(tmp_path,path)
+        except OSError:
+            # renaming over a file fails on Windows
+            try:
+                os.remove(path)
+                os.rename(tmp_path,path)
+            except OSError:
+                os.remove(tmp_path)
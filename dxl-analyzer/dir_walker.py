@@ -0,0 +1,109 @@
+#!/bin/env python
+
+# standard imports
+import os,sys
+import stat
+import Queue
+from multiprocessing.pool import ThreadPool
+
+try:
+    # directory entries with their stats without a stat call per file
+    # on Windows (os.scandir of Python 3.5)
+    from scandir import scandir
+except ImportError:
+    scandir = None
+
+# Default number of threads listing directories
+THREADS = 8
+
+
+def list_dir(path):
+    """
+        Returns (files, dirs) of directory path, in listing order, or None
+        if path can not be listed
+        files is a list of (name, size, mtime), size and mtime are None if
+        unknown, dirs a list of names of subdirectories. As with os.walk(),
+        symbolic links to directories are neither files nor subdirectories.
+    """
+
+    files = []
+    dirs = []
+
+    if scandir is not None:
+        try:
+            entries = list(scandir(path))
+        except OSError:
+            return None
+        for entry in entries:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    dirs.append(entry.name)
+                continue
+            try:
+                st = entry.stat()
+                files.append((entry.name,st.st_size,st.st_mtime))
+            except OSError:
+                files.append((entry.name,None,None))
+        return files, dirs
+
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return None
+    for name in names:
+        full_path = os.path.join(path,name)
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            files.append((name,None,None))
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            if not os.path.islink(full_path):
+                dirs.append(name)
+        else:
+            files.append((name,st.st_size,st.st_mtime))
+    return files, dirs
+
+
+def _list_dir(path,results):
+    """
+        Thread pool task: puts (path, list_dir(path), exception info) in results
+    """
+
+    try:
+        results.put((path,list_dir(path),None))
+    except:
+        results.put((path,None,sys.exc_info()))
+
+
+def walk(root_dir,threads=THREADS):
+    """
+        Lists root_dir and its subdirectories recursively, each one in a
+        pool of threads as soon as its parent is listed, so that the latency
+        of network drives is paid once per level rather than per directory
+        Returns a dictionnary path -> (files, dirs) of list_dir() for each
+        directory that could be listed
+    """
+
+    listing = dict()
+    results = Queue.Queue()
+    pool = ThreadPool(threads)
+    try:
+        pool.apply_async(_list_dir,(root_dir,results))
+        nb_pending = 1
+        while nb_pending:
+            path, result, exc_info = results.get()
+            nb_pending -= 1
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            if result is None:
+                continue
+            listing[path] = result
+            for name in result[1]:
+                pool.apply_async(_list_dir,(os.path.join(path,name),results))
+                nb_pending += 1
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return listing
@@ -0,0 +1,427 @@
+#!/bin/env python
+
+# standard imports
+import array
+import collections
+import hashlib
+import shelve
+import zlib
+
+# custom imports
+from dxl_lexer import Lexer
+
+# Default minimum number of tokens of a duplication (--minimum-tokens of CPD)
+MIN_TOKENS = 20
+
+# Token types left out of the compared code
+IGNORED_TYPES = ("C_COMMENT","CPP_COMMENT","BR")
+
+# Default maximum number of fingerprints indexed at a time
+INDEX_SIZE = 1000000
+
+# Modulus (Mersenne prime) and base of the rolling hash
+MODULUS = (1 << 61) - 1
+BASE = 1000003
+
+ignored_type_ids = set([Lexer.type_ids[type] for type in IGNORED_TYPES])
+
+
+class Fingerprints:
+    """
+        Hashes of windows of min_tokens consecutive tokens of a file, as
+        selected by winnowing: the smallest hash of each run of window
+        consecutive hashes, so that two files sharing at least
+        min_tokens+window-1 tokens share at least one fingerprint while
+        only about 2/(window+1) of the hashes are kept
+
+        Fingerprint i is the hash of the tokens from positions[i], in the
+        tokens left after IGNORED_TYPES, on lines first_lines[i] to
+        last_lines[i]. The hash and line of each of these tokens are
+        kept in token_hashes and token_lines to extend the matches.
+    """
+
+    def __init__(self,min_tokens):
+        self.min_tokens = min_tokens
+        self.token_hashes = array.array("I")
+        self.token_lines = array.array("i")
+        # 61 bits hashes in 2 arrays of 32 bits, "L" is 32 bits on Windows
+        self.high_hashes = array.array("I")
+        self.low_hashes = array.array("I")
+        self.positions = array.array("i")
+        self.first_lines = array.array("i")
+        self.last_lines = array.array("i")
+
+    def __len__(self):
+        return len(self.positions)
+
+    def append(self,hash,position,first_line,last_line):
+        self.high_hashes.append(hash >> 32)
+        self.low_hashes.append(hash & 0xffffffff)
+        self.positions.append(position)
+        self.first_lines.append(first_line)
+        self.last_lines.append(last_line)
+
+    def hash(self,i):
+        return (self.high_hashes[i] << 32) | self.low_hashes[i]
+
+    def digest(self):
+        """
+            Returns a string identifying the compared tokens, the same for
+            files whose code only differs by comments and layout
+            The fingerprints alone do not identify the code: tokens outside
+            the windows selected by winnowing may differ.
+        """
+
+        return hashlib.sha1(self.token_hashes.tostring()).hexdigest()
+
+    def __arrays(self):
+        return (self.token_hashes,self.token_lines,self.high_hashes,self.low_hashes,self.positions,self.first_lines,self.last_lines)
+
+    def __getstate__(self):
+        # arrays are pickled as lists of ints otherwise
+        return (self.min_tokens,[a.tostring() for a in self.__arrays()])
+
+    def __setstate__(self,state):
+        self.__init__(state[0])
+        for a, data in zip(self.__arrays(),state[1]):
+            a.fromstring(data)
+
+
+class Duplication:
+    """
+        Code of tokens tokens found at each (path, first line, last line)
+        of occurrences, sorted
+    """
+
+    def __init__(self,tokens,occurrences):
+        self.tokens = tokens
+        self.occurrences = occurrences
+
+
+def fingerprint(tokens,min_tokens=MIN_TOKENS,window=None):
+    """
+        Returns the Fingerprints of Lexer.TokenTable tokens
+        window defaults to min_tokens
+    """
+
+    if window is None:
+        window = min_tokens
+    fingerprints = Fingerprints(min_tokens)
+
+    # hash and line of each compared token, values without layout
+    token_hashes = fingerprints.token_hashes
+    lines = fingerprints.token_lines
+    for i in xrange(len(tokens)):
+        if tokens.types[i] in ignored_type_ids:
+            continue
+        value = " ".join(tokens.value(i).split())
+        token_hashes.append(zlib.crc32(value) & 0xffffffff)
+        lines.append(tokens.lines[i])
+
+    if len(token_hashes) < min_tokens:
+        return fingerprints
+
+    power = pow(BASE,min_tokens-1,MODULUS)
+    # (hash, position) of the windows of the current run, increasing
+    # hashes, rightmost position of equal hashes
+    candidates = collections.deque()
+    selected = -1
+    h = 0
+    for i, token_hash in enumerate(token_hashes):
+        if i >= min_tokens:
+            h = (h - token_hashes[i-min_tokens]*power) % MODULUS
+        h = (h*BASE + token_hash) % MODULUS
+        position = i-min_tokens+1
+        if position < 0:
+            continue
+
+        while candidates and candidates[-1][0] >= h:
+            candidates.pop()
+        candidates.append((h,position))
+        while candidates[0][1] <= position-window:
+            candidates.popleft()
+
+        # a run of window hashes ends at position, or the file is
+        # shorter than one run
+        if position >= window-1 or i == len(token_hashes)-1:
+            min_hash, min_position = candidates[0]
+            if min_position != selected:
+                selected = min_position
+                fingerprints.append(min_hash,min_position,lines[min_position],lines[min_position+min_tokens-1])
+
+    return fingerprints
+
+
+class DuplicateFinder:
+    """
+        Finds the code duplicated in and between files from their
+        Fingerprints, computed with the same min_tokens
+
+        Fingerprints are indexed by ranges of hashes of at most about
+        index_size fingerprints, so that the memory of the index does not
+        grow with the number of files. Only the matches are kept between
+        ranges. The tokens of the files, read again to extend the matches,
+        are kept in the shelve tokens_file if given.
+
+        Files with the same code as a file added before are only kept as
+        its aliases: reported as a duplication of the whole file and as
+        occurrences of each duplication of the file. Files are compared in
+        the order of their paths, so that the duplications found do not
+        depend on the order the files are added.
+    """
+
+    def __init__(self,min_tokens=MIN_TOKENS,index_size=INDEX_SIZE,tokens_file=None):
+        self.min_tokens = min_tokens
+        self.__index_size = index_size
+        self.__paths = []
+        # paths of the files with the same code as each file added
+        self.__aliases = []
+        self.__fingerprints = []
+        # file -> (token hashes, token lines), "file_k" -> token lines of
+        # alias k of file
+        if tokens_file is None:
+            self.__tokens = dict()
+        else:
+            self.__tokens = shelve.open(tokens_file,"n",2)
+        # paths of the files added, code of the files added -> file
+        self.__added = set()
+        self.__digests = dict()
+        self.__nb_fingerprints = 0
+
+    def add(self,path,fingerprints):
+        """
+            Adds the Fingerprints of the file path, if not added before,
+            as an alias of the file with the same code if one was added
+        """
+
+        if path in self.__added:
+            return
+        self.__added.add(path)
+
+        if not len(fingerprints):
+            return
+
+        digest = fingerprints.digest()
+        if digest in self.__digests:
+            # only the lines of the tokens differ
+            f = self.__digests[digest]
+            self.__tokens["%d_%d" % (f,len(self.__aliases[f]))] = fingerprints.token_lines
+            self.__aliases[f].append(path)
+            return
+        self.__digests[digest] = len(self.__paths)
+
+        self.__tokens[str(len(self.__paths))] = (fingerprints.token_hashes,fingerprints.token_lines)
+        fingerprints.token_hashes = None
+        fingerprints.token_lines = None
+
+        self.__paths.append(path)
+        self.__aliases.append([])
+        self.__fingerprints.append(fingerprints)
+        self.__nb_fingerprints += len(fingerprints)
+
+    def close(self):
+        """
+            Closes the tokens_file
+        """
+
+        if not isinstance(self.__tokens,dict):
+            self.__tokens.close()
+
+    def __path_key(self,f):
+        """
+            Returns the key ordering file f by path, the first path of its
+            aliases
+        """
+
+        return min([self.__paths[f]]+self.__aliases[f])
+
+    def __matches(self):
+        """
+            Returns a dictionnary (file, other file, offset of positions) ->
+            sorted list of the positions in file of the fingerprints shared
+            by both files, each file of a hash being matched with the first
+            in path order
+        """
+
+        matches = dict()
+        files = sorted(xrange(len(self.__paths)),key=self.__path_key)
+        nb_ranges = self.__nb_fingerprints/self.__index_size+1
+        for hash_range in xrange(nb_ranges):
+            # hash -> list of (file, fingerprint)
+            index = dict()
+            for f in files:
+                fingerprints = self.__fingerprints[f]
+                for i, low_hash in enumerate(fingerprints.low_hashes):
+                    if low_hash % nb_ranges == hash_range:
+                        h = fingerprints.hash(i)
+                        if not h in index:
+                            index[h] = []
+                        index[h].append((f,i))
+
+            for occurrences in index.itervalues():
+                if len(occurrences) < 2:
+                    continue
+                f, i = occurrences[0]
+                position = self.__fingerprints[f].positions[i]
+                for other_f, other_i in occurrences[1:]:
+                    key = (f,other_f,self.__fingerprints[other_f].positions[other_i]-position)
+                    if not key in matches:
+                        matches[key] = []
+                    matches[key].append(position)
+
+        for positions in matches.itervalues():
+            positions.sort()
+
+        return matches
+
+    def __extend(self,start,end,offset,tokens,other_tokens):
+        """
+            Returns (start, end) of the tokens from start to end (excluded)
+            equal to the ones offset positions further in other_tokens,
+            extended to the tokens around them equal too, or None if
+            the hashes of the tokens are not equal
+        """
+
+        token_hashes = tokens[0]
+        other_hashes = other_tokens[0]
+        if token_hashes[start:end] != other_hashes[start+offset:end+offset]:
+            return None
+
+        while start > 0 and start+offset > 0 and token_hashes[start-1] == other_hashes[start+offset-1]:
+            start -= 1
+        while end < len(token_hashes) and end+offset < len(other_hashes) and token_hashes[end] == other_hashes[end+offset]:
+            end += 1
+
+        return start, end
+
+    def __extended_matches(self):
+        """
+            Returns a dictionnary file -> (start, end) of code -> set of
+            (other file, start in other file) of the same code, from the
+            matches extended to the tokens around them
+        """
+
+        extended_matches = dict()
+        matches = self.__matches()
+        tokens = None
+        for f, other_f, offset in sorted(matches):
+            if tokens is None or tokens[0] != f:
+                tokens = (f,self.__tokens[str(f)])
+            other_tokens = self.__tokens[str(other_f)]
+
+            end = 0
+            for position in matches[(f,other_f,offset)]:
+                # fingerprint within a match extended before
+                if position+self.min_tokens <= end:
+                    continue
+                extended = self.__extend(position,position+self.min_tokens,offset,tokens[1],other_tokens)
+                if extended is None:
+                    continue
+                start, end = extended
+                # repeated code overlapping itself
+                if f == other_f and abs(offset) < end-start:
+                    continue
+
+                if not f in extended_matches:
+                    extended_matches[f] = dict()
+                if not (start,end) in extended_matches[f]:
+                    extended_matches[f][start,end] = set()
+                extended_matches[f][start,end].add((other_f,start+offset))
+
+        return extended_matches
+
+    def __grouped_matches(self,code_matches):
+        """
+            Returns a list of (start, end, set of (other file, start in
+            other file)) of the code_matches of a file, the ones of the
+            same code extended by chance by less than min_tokens tokens
+            grouped on their common tokens
+        """
+
+        groups = []
+        for start, end in sorted(code_matches):
+            others = set()
+            if groups:
+                group_start, group_end, others = groups[-1]
+                common_start = max(start,group_start)
+                common_end = min(end,group_end)
+                if common_end-common_start > max(end-start,group_end-group_start)-self.min_tokens:
+                    groups[-1] = (common_start,common_end,set([(other_f,other_start+common_start-group_start) for other_f, other_start in others]))
+                    others = groups[-1][2]
+                    for other_f, other_start in code_matches[start,end]:
+                        others.add((other_f,other_start+common_start-start))
+                    continue
+            groups.append((start,end,set(code_matches[start,end])))
+
+        return groups
+
+    def duplications(self):
+        """
+            Returns the Duplications found, most tokens first, and the
+            whole files duplicated by their aliases
+            Duplications whose occurrences are all parts of the ones of a
+            duplication with more tokens, as in code repeated many times,
+            are left out.
+        """
+
+        path_keys = [self.__path_key(f) for f in xrange(len(self.__paths))]
+        range_key = lambda (f, start): (path_keys[f],start)
+
+        # (tokens, [(file, start) of each occurrence])
+        duplications = []
+        for f, code_matches in self.__extended_matches().iteritems():
+            for start, end, others in self.__grouped_matches(code_matches):
+                # occurrences overlapping the ones before them in the same
+                # file, in code repeated many times
+                ranges = []
+                for other_f, other_start in [(f,start)]+sorted(others,key=range_key):
+                    if not [1 for range_f, range_start in ranges if range_f == other_f and abs(range_start-other_start) < end-start]:
+                        ranges.append((other_f,other_start))
+                if len(ranges) > 1:
+                    duplications.append((end-start,ranges))
+        duplications.sort(key=lambda (tokens, ranges): (-tokens,map(range_key,ranges)))
+
+        kept_duplications = []
+        # file -> (start, end) of the occurrences of the duplications kept
+        kept = dict()
+        for tokens, ranges in duplications:
+            contained = True
+            for f, start in ranges:
+                if not [1 for kept_start, kept_end in kept.get(f,[]) if kept_start <= start and start+tokens <= kept_end]:
+                    contained = False
+                    break
+            if contained:
+                continue
+
+            for f, start in ranges:
+                if not f in kept:
+                    kept[f] = []
+                kept[f].append((start,start+tokens))
+            kept_duplications.append((tokens,ranges))
+
+        # occurrences in each file and in its aliases, tokens of each
+        # file read once
+        occurrences_dict = dict()
+        duplications_list = []
+        for f in xrange(len(self.__paths)):
+            if not f in kept and not self.__aliases[f]:
+                continue
+            files = [(self.__paths[f],self.__tokens[str(f)][1])]
+            for k, path in enumerate(self.__aliases[f]):
+                files.append((path,self.__tokens["%d_%d" % (f,k)]))
+
+            for start, end in kept.get(f,[]):
+                occurrences_dict[f,start,end] = [(path,token_lines[start],token_lines[end-1]) for path, token_lines in files]
+
+            if self.__aliases[f]:
+                # code of the whole file
+                duplications_list.append(Duplication(len(files[0][1]),sorted([(path,token_lines[0],token_lines[-1]) for path, token_lines in files])))
+
+        for tokens, ranges in kept_duplications:
+            occurrences = []
+            for f, start in ranges:
+                occurrences.extend(occurrences_dict[f,start,start+tokens])
+            duplications_list.append(Duplication(tokens,sorted(occurrences)))
+        duplications_list.sort(key=lambda d: (-d.tokens,d.occurrences))
+
+        return duplications_list
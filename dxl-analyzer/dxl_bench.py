@@ -0,0 +1,296 @@
+#!/bin/env python
+
+# standard imports
+import sys
+import argparse
+import json
+import random
+import time
+import platform
+import multiprocessing
+
+# custom imports
+import ply
+from dxl_lexer import get_lexer
+
+try:
+    import resource
+except ImportError:
+    # no peak memory measurement on Windows
+    resource = None
+
+# Weights of the kinds of generated lines
+MIX = {
+    "statement": 30,
+    "c_comment": 5,
+    "cpp_comment": 10,
+    "include": 3,
+    "pragma": 1,
+    "function_call": 20,
+    "function_declaration": 5,
+    "string_init": 15,
+    "array_def": 2,
+    "long_line": 1,
+}
+
+# Length in bytes of generated long lines
+LONG_LINE_LENGTH = 2000
+
+# Benchmarked Lexer functions
+FUNCTIONS = ("init","get_tokens","get_func_declarations")
+
+SIZES = (16*1024,128*1024,1024*1024)
+
+# Numbers of unclosed calls of the worst-case lines
+WORST_CASE_COUNTS = (250,500,1000)
+
+
+def generate_line(kind,rand,long_line_length=LONG_LINE_LENGTH):
+    """
+        Returns a generated DXL line (or block) of the given kind
+    """
+
+    name = "%s%d" % (rand.choice(["count","obj","mod","attr","item"]),rand.randint(0,999))
+
+    if kind == "statement":
+        return "%s = %s + %d" % (name,rand.choice(["a","b","c"]),rand.randint(0,99))
+    elif kind == "c_comment":
+        return "/* %s\n   %s */" % (name,"description of "+name)
+    elif kind == "cpp_comment":
+        return "// %s is %s" % (name,rand.choice(["used","set","checked"]))
+    elif kind == "include":
+        return rand.choice(["#include <lib/%s.inc>","#include \"utils/%s.inc\""]) % name
+    elif kind == "pragma":
+        return rand.choice(["pragma runLim, 0","pragma stack, 1000000","pragma encoding, \"UTF-8\""])
+    elif kind == "function_call":
+        return "%s(%s, \"%s\")" % (name,rand.choice(["a","b","current"]),name)
+    elif kind == "function_declaration":
+        return "%s %s(%s a) {\n    return a\n}" % (rand.choice(["int","bool","string","void"]),name,rand.choice(["int","string","Object"]))
+    elif kind == "string_init":
+        return "string %s = \"%s\"" % (name,name)
+    elif kind == "array_def":
+        return "int %s[] = {1,2,3}" % name
+    elif kind == "long_line":
+        line = "%s = " % name
+        while len(line) < long_line_length:
+            line += "f(%s) + " % rand.choice(["a","b","c"])
+        return line + "0"
+
+    raise ValueError("unknown kind of line: %s" % kind)
+
+
+def generate_dxl(size,mix=MIX,seed=0,long_line_length=LONG_LINE_LENGTH):
+    """
+        Returns generated DXL content of about size bytes whose lines
+        are drawn from the kinds of mix with their weights
+    """
+
+    rand = random.Random(seed)
+    kinds = []
+    for kind, weight in sorted(mix.items()):
+        kinds += [kind]*weight
+
+    lines = []
+    length = 0
+    while length < size:
+        line = generate_line(rand.choice(kinds),rand,long_line_length)
+        lines.append(line)
+        length += len(line)+1
+
+    return "\n".join(lines)+"\n"
+
+
+def worst_case_line(n):
+    """
+        Returns a generated DXL line of n calls never closed on the line
+        and brackets never assigned: ARRAY_DEF and FUNCTION regex backtrack
+        to the end of the line at every token
+    """
+
+    return "x = " + "a(b + c[i] + " * n + "d\n"
+
+
+def run_worst_case(counts=WORST_CASE_COUNTS,options=None):
+    """
+        Returns lines timing the analysis of worst_case_line() of each
+        count, in default and linear modes
+    """
+
+    if options is None:
+        options = dict()
+
+    lines = []
+    for n in counts:
+        data = worst_case_line(n)
+        for linear in [False,True]:
+            lexer = get_lexer(**dict(options,linear=linear))
+            start_time = time.time()
+            lexer.analyse(data)
+            lines.append("%-7s mode, %6d bytes line: %.3f s" % (["default","linear"][linear],len(data),time.time()-start_time))
+    return lines
+
+
+def peak_memory():
+    """
+        Returns the peak resident memory of the process in KB, None if unknown
+    """
+
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_case(function,data,options,repeat,queue):
+    """
+        Times function of a Lexer on data (best of repeat runs) and puts
+        the result in queue. Runs in its own process so that peak memory
+        is the one of this case only.
+    """
+
+    lexer = get_lexer(**options)
+    memory_before = peak_memory()
+
+    seconds = None
+    for i in xrange(repeat):
+        start_time = time.time()
+        getattr(lexer,function)(data)
+        elapsed = time.time()-start_time
+        if seconds is None or elapsed < seconds:
+            seconds = elapsed
+
+    memory_after = peak_memory()
+    nb_tokens = len(lexer.analyse(data).tokens)
+    result = {
+        "function": function,
+        "bytes": len(data),
+        "lines": data.count("\n"),
+        "tokens": nb_tokens,
+        "seconds": seconds,
+        "tokens_per_sec": nb_tokens/max(seconds,1e-9),
+        "bytes_per_sec": len(data)/max(seconds,1e-9),
+        "peak_memory_kb": memory_after,
+        "peak_memory_delta_kb": None,
+    }
+    if memory_after is not None:
+        result["peak_memory_delta_kb"] = memory_after-memory_before
+    queue.put(result)
+
+
+def run(sizes=SIZES,functions=FUNCTIONS,options=None,mix=MIX,seed=0,repeat=3,long_line_length=LONG_LINE_LENGTH):
+    """
+        Runs every function on generated DXL files of every size
+        Returns the results as a JSON serializable dictionary
+    """
+
+    if options is None:
+        options = dict()
+
+    results = []
+    for size in sizes:
+        data = generate_dxl(size,mix,seed,long_line_length)
+        for function in functions:
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=run_case,args=(function,data,options,repeat,queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            result["size"] = size
+            results.append(result)
+
+    return {
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "ply": ply.__version__,
+        "options": options,
+        "mix": mix,
+        "seed": seed,
+        "repeat": repeat,
+        "long_line_length": long_line_length,
+        "results": results,
+    }
+
+
+def compare(report,reference):
+    """
+        Returns lines comparing the tokens/sec of report with the ones
+        of reference for the cases found in both
+    """
+
+    reference_results = dict()
+    for result in reference["results"]:
+        reference_results[(result["function"],result["size"])] = result
+
+    lines = []
+    for result in report["results"]:
+        key = (result["function"],result["size"])
+        if key in reference_results:
+            ratio = result["tokens_per_sec"]/max(reference_results[key]["tokens_per_sec"],1e-9)
+            lines.append("%-22s %9d bytes: %.2fx" % (result["function"],result["size"],ratio))
+    return lines
+
+
+def parse_size(size):
+    """
+        "16k" -> 16384, "1m" -> 1048576
+    """
+
+    size = size.strip().lower()
+    if size.endswith("k"):
+        return int(size[:-1])*1024
+    if size.endswith("m"):
+        return int(size[:-1])*1024*1024
+    return int(size)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks dxl_lexer.Lexer on generated DXL files")
+    parser.add_argument("-s","--sizes",default="16k,128k,1m",help="comma separated file sizes (default: %(default)s)")
+    parser.add_argument("-f","--functions",default=",".join(FUNCTIONS),help="comma separated Lexer functions (default: %(default)s)")
+    parser.add_argument("-r","--repeat",type=int,default=3,help="runs per case, the best one is kept (default: %(default)s)")
+    parser.add_argument("--seed",type=int,default=0,help="corpus generator seed (default: %(default)s)")
+    parser.add_argument("--long-line-length",type=int,default=LONG_LINE_LENGTH,help="length of generated long lines (default: %(default)s)")
+    parser.add_argument("--mix",default=None,help="comma separated kind=weight overriding the default mix, e.g. long_line=0")
+    parser.add_argument("-L","--linear-lexing",action="store_true",help="benchmark the linear lexing mode")
+    parser.add_argument("-S","--scanner",action="store_true",help="benchmark the scanner engine")
+    parser.add_argument("-l","--lextab",action="store_true",help="read the lexer tables written in the temporary directory by the first run")
+    parser.add_argument("-o","--output",default=None,help="JSON results file (default: standard output)")
+    parser.add_argument("-c","--compare",default=None,help="JSON results file of a previous run to compare with")
+    parser.add_argument("--dump",default=None,help="write the generated DXL file of the first size to this path and exit")
+    parser.add_argument("--worst-case",action="store_true",help="time the default and linear modes on worst-case lines and exit")
+    args = parser.parse_args()
+
+    mix = dict(MIX)
+    if args.mix:
+        for item in args.mix.split(","):
+            kind, weight = item.split("=")
+            if not kind in MIX:
+                parser.error("unknown kind of line: %s" % kind)
+            mix[kind] = int(weight)
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+
+    if args.dump:
+        with open(args.dump,"wb") as f:
+            f.write(generate_dxl(sizes[0],mix,args.seed,args.long_line_length))
+        sys.exit(0)
+
+    if args.worst_case:
+        for line in run_worst_case(options={"optimize": args.lextab, "scanner": args.scanner}):
+            print line
+        sys.exit(0)
+
+    options = {"optimize": args.lextab, "linear": args.linear_lexing, "scanner": args.scanner}
+    report = run(sizes,args.functions.split(","),options,mix,args.seed,args.repeat,args.long_line_length)
+
+    if args.output:
+        with open(args.output,"wb") as f:
+            json.dump(report,f,indent=2,sort_keys=True)
+    else:
+        print json.dumps(report,indent=2,sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            reference = json.load(f)
+        for line in compare(report,reference):
+            sys.stderr.write(line+"\n")
@@ -1,9 +1,42 @@
 import ply.lex
 import re
+import sys
+import os
+import bisect
+import mmap
+import array
+import sre_parse
+import sre_constants
+import timeit
+import hashlib
+import imp
+import tempfile
+
+# Prefix of the modules of the lexing tables written in optimize mode,
+# named after the hash of the rules they are built from
+LEXTAB = "dxl_lextab"
+
+# Rules matched in linear time by Lexer.token() in linear mode instead of
+# by their backtracking regex in the ply master regex
+LINEAR_RULES = ("ARRAY_DEF","FUNCTION")
+# Stands for a linear rule in the master regex
+NEVER_MATCH = r'(?!)'
+
+# Size of the windows lexed by Lexer.analyse_file()
+CHUNK_SIZE = 256*1024
+
+_shared_lexers = dict()
 
 class Lexer:
-    def __init__(self):
+    def __init__(self,linear=False,scanner=False,profile=False):
         self.__last_newline_lexpos = 0
+        self.__newline_marks = None
+        self.linear = linear
+        self.scanner = scanner
+        self.profile = profile
+        # rule name -> [matches, seconds] in profile mode
+        self.rule_stats = dict()
+        self.__rule = None
 
     class Token:
         def __init__(self,value=None,type=None,line=0,column=0):
@@ -12,6 +45,154 @@ class Lexer:
             self.line = line
             self.column = column
 
+    class TokenTable:
+        """
+            Tokens stored in parallel arrays (type id, start and end offsets,
+            line, column) with an index of the first token of each line
+            Values are sliced from data, or from dxl_file memory-mapped until
+            close(), only when a token is requested
+        """
+
+        def __init__(self,data="",dxl_file=None):
+            self.data = data
+            self.dxl_file = dxl_file
+            self.types = array.array("B")
+            self.starts = array.array("i")
+            self.ends = array.array("i")
+            self.lines = array.array("i")
+            self.columns = array.array("i")
+            self.line_index = array.array("i",[0,0])
+            self.__file = None
+            self.__data = None
+
+        def __len__(self):
+            return len(self.types)
+
+        def append(self,type,start,end,line,column):
+            self.types.append(Lexer.type_ids[type])
+            self.starts.append(start)
+            self.ends.append(end)
+            self.lines.append(line)
+            self.columns.append(column)
+
+        def append_token(self,tok):
+            # some SYS_CALL tokens are mistaken for FUNCTION ones
+            type = tok.type
+            if type == "FUNCTION":
+                if tok.value[:6] == "system":
+                    type = "SYS_CALL"
+            self.append(type,tok.lexpos,tok.lexpos+len(tok.value),tok.lineno,tok.column)
+
+        def replace(self,i,j,tokens,first_line,sync_line,delta,line_delta,data):
+            """
+                Replaces tokens i to j (excluded), which start on line
+                first_line or after, by the TokenTable tokens lexed in data,
+                the edited source. Tokens from sync_line (None when re-lexed
+                up to the end) are moved by delta characters and line_delta lines
+            """
+
+            k = i + len(tokens)
+            self.types[i:] = tokens.types + self.types[j:]
+            self.starts[i:] = tokens.starts + array.array("i",[start+delta for start in self.starts[j:]])
+            self.ends[i:] = tokens.ends + array.array("i",[end+delta for end in self.ends[j:]])
+            self.lines[i:] = tokens.lines + array.array("i",[line+line_delta for line in self.lines[j:]])
+            self.columns[i:] = tokens.columns + self.columns[j:]
+
+            nb_lines = 0
+            if self.lines:
+                nb_lines = self.lines[-1]
+            line_index = self.line_index[:first_line+1]
+            if sync_line is not None:
+                line_index.extend([bisect.bisect_left(self.lines,l) for l in xrange(len(line_index),sync_line+line_delta)])
+                line_index.extend([index+k-j for index in self.line_index[sync_line:]])
+            line_index.extend([bisect.bisect_left(self.lines,l) for l in xrange(len(line_index),nb_lines+2)])
+            self.line_index = line_index
+
+            self.data = data
+            self.close()
+
+        def index_lines(self):
+            """
+                Tokens of line l are the ones from line_index[l] to line_index[l+1]
+            """
+
+            nb_lines = 0
+            if self.lines:
+                nb_lines = self.lines[-1]
+            self.line_index = array.array("i",[0]*(nb_lines+2))
+            i = 0
+            for l in xrange(nb_lines+2):
+                while i < len(self.lines) and self.lines[i] < l:
+                    i += 1
+                self.line_index[l] = i
+
+        def line_numbers(self):
+            """
+                Returns the sorted numbers of lines holding tokens
+            """
+
+            return [l for l in xrange(1,len(self.line_index)-1) if self.line_index[l] < self.line_index[l+1]]
+
+        def value(self,i):
+            if self.__data is None:
+                if self.dxl_file is None:
+                    self.__data = self.data
+                else:
+                    self.__file = open(self.dxl_file,"rb")
+                    self.__data = mmap.mmap(self.__file.fileno(),0,access=mmap.ACCESS_READ)
+            return self.__data[self.starts[i]:self.ends[i]]
+
+        def token(self,i):
+            """
+                Returns token i as a Lexer.Token, value formatted for HTML
+            """
+
+            value = self.value(i)
+            type = Lexer.tokens[self.types[i]]
+            if type == "CPP_COMMENT":
+                if value.startswith("//#include") or value.startswith("// #include"):
+                    value = value.replace("<","&lt").replace(">","&gt")
+            elif type == "C_COMMENT":
+                value = value.replace("\n","<br>\n").replace("\t","&nbsp;"*8).replace(" ","&nbsp;")
+
+            return Lexer.Token(value,type,self.lines[i],self.columns[i])
+
+        def line_tokens(self,l):
+            """
+                Returns Lexer.Token objects of line l
+            """
+
+            if l < 0 or l+1 >= len(self.line_index):
+                return []
+            return [self.token(i) for i in xrange(self.line_index[l],self.line_index[l+1])]
+
+        def close(self):
+            """
+                Releases the DXL file mapped to read token values
+            """
+
+            if self.__file is not None:
+                self.__data.close()
+                self.__file.close()
+                self.__file = None
+            self.__data = None
+
+    class Analysis:
+        def __init__(self,data="",dxl_file=None):
+            self.tokens = Lexer.TokenTable(data,dxl_file)
+            self.include_dict = dict()
+            self.string_init_dict = dict()
+            self.string_init_loop_dict = dict()
+            self.pragma_dict = dict()
+            self.sys_call_dict = dict()
+            self.var_single_line_dict = dict()
+            self.func_called = []
+            self.func_declarations_dict = dict()
+            self.is_exec_by_doors = False
+            self.nb_lines = 0
+            # size of the content in bytes
+            self.size = len(data)
+
     #-----------------------------------------------------------------------------------------
     # Tokens definitions
     #-----------------------------------------------------------------------------------------
@@ -61,6 +242,9 @@ class Lexer:
         'ARRAY_DEF', 'BR'
     )
 
+    # token type -> id stored in TokenTable
+    type_ids = dict([(type, i) for i, type in enumerate(tokens)])
+
     #------------------------------------------------------------------------------------------
     # Reserved identifiers
     #------------------------------------------------------------------------------------------
@@ -210,6 +394,8 @@ class Lexer:
         r'\n+'
         t.lexer.lineno += t.value.count("\n")
         self.__last_newline_lexpos = t.lexer.lexpos
+        if self.__newline_marks is not None:
+            self.__newline_marks.append((t.lexer.lexpos,t.lexer.lineno))
 
     def t_ANY_error(self,t):
         ##print("Illegal character '%s'" % t.value[0])
@@ -218,23 +404,547 @@ class Lexer:
     t_ANY_ignore = ' \t'
 
     def build(self,**kwargs):
-        self.lexer = lex.lex(module=self, **kwargs)
+        if self.linear:
+            # shadow the backtracking rules with string rules never matching
+            for rule in LINEAR_RULES:
+                setattr(self,"t_"+rule,NEVER_MATCH)
+        self.lexer = ply.lex.lex(module=self, **kwargs)
+        self.__build_scanner()
+
+    def clone(self):
+        """
+            Returns a new Lexer sharing the compiled lexing tables of this one
+            Each clone keeps its own position, line number and column state
+        """
 
+        c = Lexer(self.linear,self.scanner,self.profile)
+        c.lexer = self.lexer.clone(c)
+        # ply clone() rebinds the state tables but not the active one
+        c.lexer.begin("INITIAL")
+        c.__scanner_rules = self.__scanner_rules
+        c.__scanner_rules_no_array_def = self.__scanner_rules_no_array_def
+        return c
 
-    def get_tokens(self,data):
+
+    #--------------------------------------------------------------------------------------
+    # Scanner engine
+    #--------------------------------------------------------------------------------------
+
+    def __build_scanner(self):
         """
-            Gets tokens of interest to analyze them in dxl_scan.py
+            Compiles, for each character, the alternation of the ply rules
+            (in ply order) that can match from it, whose group indexes give
+            the token type, and the same tables without ARRAY_DEF for the
+            input where it cannot match
+        """
+
+        names = []
+        for lexre, lexindexfunc in self.lexer.lexre:
+            names += sorted(lexre.groupindex,key=lexre.groupindex.get)
+
+        rules = []
+        for name in names:
+            rule = getattr(self,name)
+            if not isinstance(rule,basestring):
+                rule = rule.__doc__
+            if rule != NEVER_MATCH:
+                rules.append((name,rule,first_chars(rule)))
+
+        def dispatch_table(rules):
+            table = dict()
+            alternations = dict()
+            for c in map(chr,xrange(256)):
+                names = tuple([name for name, rule, first in rules if c in first])
+                if not names:
+                    continue
+                if not names in alternations:
+                    regex = re.compile("|".join(["(?P<%s>%s)" % (name,rule) for name, rule, first in rules if name in names]),re.VERBOSE)
+                    alternations[names] = (regex, dict([(regex.groupindex[name], name[2:]) for name in names]))
+                table[c] = alternations[names]
+            return table
+
+        self.__scanner_rules = dispatch_table(rules)
+        self.__scanner_rules_no_array_def = dispatch_table([rule for rule in rules if rule[0] != "t_ARRAY_DEF"])
+
+    def __scanner_tables(self,data):
+        """
+            Lists the regions where ARRAY_DEF may match: (.*)(\s*|) reaches
+            a '[] = {' from its line, or from the previous non-blank line
+        """
+
+        self.__array_def_regions = []
+        for m in self.__array_def_re.finditer(data):
+            i = m.start()-1
+            while i >= 0 and data[i].isspace():
+                i -= 1
+            start = data.rfind("\n",0,max(i,0))+1
+            if self.__array_def_regions and start <= self.__array_def_regions[-1][1]:
+                start = self.__array_def_regions.pop()[0]
+            self.__array_def_regions.append((start,m.start()))
+        self.__array_def_regions.append((len(data)+1,len(data)+1))
+
+        self.__scan_tokens = self.__scan()
+
+    def __scan(self):
+        """
+            Generates the tokens of the current input from lexer.lexpos,
+            matching the alternation dispatched on the next character
+            instead of calling ply rules: t_ID, t_newline, comments and
+            t_ANY_error are inlined and reserved_map is the dispatch table
+            for identifiers
+            Generates None at the end of the input, and in linear or profile
+            mode after each discarded match, as __master_token() does
+        """
+
+        lexer = self.lexer
+        data = lexer.lexdata
+        length = lexer.lexlen
+        ignore = self.t_ANY_ignore
+        ignore_re = re.compile("[%s]+" % re.escape(ignore))
+        reserved_map = self.reserved_map
+        rules = self.__scanner_rules
+        rules_no_array_def = self.__scanner_rules_no_array_def
+        single_step = self.linear or self.profile
+        profile = self.profile
+        regions = iter(self.__array_def_regions)
+        region_start, region_end = next(regions)
+
+        pos = lexer.lexpos
+        while True:
+            if pos >= length:
+                lexer.lexpos = pos
+                yield None
+                pos = lexer.lexpos
+                continue
+
+            c = data[pos]
+            if c in ignore:
+                pos = ignore_re.match(data,pos).end()
+                continue
+
+            while pos > region_end:
+                region_start, region_end = next(regions)
+            if pos >= region_start:
+                alternation = rules.get(c)
+            else:
+                alternation = rules_no_array_def.get(c)
+
+            m = None
+            if alternation is not None:
+                regex, types = alternation
+                m = regex.match(data,pos)
+
+            if m is None:
+                # t_ANY_error
+                pos += 1
+                if profile:
+                    self.__rule = "t_ANY_error"
+                if single_step:
+                    lexer.lexpos = pos
+                    yield None
+                    pos = lexer.lexpos
+                continue
+
+            type = types[m.lastindex]
+            value = m.group()
+            end = m.end()
+            if profile:
+                self.__rule = "t_"+type
+
+            if type == "newline":
+                lexer.lineno += len(value)
+                self.__last_newline_lexpos = end
+                if self.__newline_marks is not None:
+                    self.__newline_marks.append((end,lexer.lineno))
+                pos = end
+                if single_step:
+                    lexer.lexpos = pos
+                    yield None
+                    pos = lexer.lexpos
+                continue
+
+            tok = ply.lex.LexToken()
+            tok.value = value
+            tok.lineno = lexer.lineno
+            tok.lexpos = pos
+            tok.lexer = lexer
+            if type == "ID":
+                type = reserved_map.get(value,type)
+            elif type == "CPP_COMMENT" or type == "C_COMMENT":
+                lexer.lineno += value.count("\n")
+            tok.type = type
+            lexer.lexpos = end
+            yield tok
+            pos = lexer.lexpos
+
+
+    #--------------------------------------------------------------------------------------
+    # Linear mode
+    #--------------------------------------------------------------------------------------
+
+    __string_init_re = re.compile(t_STRING_INIT.__doc__, re.VERBOSE)
+    __sys_call_re = re.compile(t_SYS_CALL.__doc__, re.VERBOSE)
+    __pragma_re = re.compile(t_PRAGMA.__doc__, re.VERBOSE)
+    __func_keyword_re = re.compile(r'(if|else|for|while)\b')
+    __word_re = re.compile(r'\w+')
+    __word_char_re = re.compile(r'\w')
+    __space_re = re.compile(r'\s*')
+    __space_char_re = re.compile(r'\s')
+    __array_def_re = re.compile(r'\[\]\s*=\s*\{')
+    __rparen_re = re.compile(r'\)\s*(\{)?')
+
+    def __linear_tables(self,data):
+        """
+            Indexes data once so that ARRAY_DEF and FUNCTION tokens
+            are found with bisections instead of regex backtracking
+        """
+
+        self.__newlines = [m.start() for m in re.finditer("\n",data)]
+        rbraces = [m.start() for m in re.finditer("}",data)]
+
+        # ')' ending a FUNCTION token: not followed by '{' after whitespaces
+        self.__rparens = [m.start() for m in self.__rparen_re.finditer(data) if m.group(1) is None]
+
+        # '[] = {' with a '}' after the '{' on its line, and where ARRAY_DEF ends
+        self.__array_defs = []
+        self.__array_def_ends = dict()
+        for m in self.__array_def_re.finditer(data):
+            lbrace = m.end()-1
+            i = bisect.bisect_left(rbraces,self.__eol(lbrace))-1
+            if i >= 0 and rbraces[i] > lbrace:
+                self.__array_defs.append(m.start())
+                self.__array_def_ends[m.start()] = rbraces[i]+1
+
+        self.__next_line_starts = dict()
+
+    def __eol(self,pos):
+        i = bisect.bisect_left(self.__newlines,pos)
+        if i < len(self.__newlines):
+            return self.__newlines[i]
+        return len(self.lexer.lexdata)
+
+    def __match_array_def(self,data,pos):
+        """
+            Returns the end of the ARRAY_DEF token starting at pos or None
+            (.*)(\s*|) reaches any '[]' left on the line or the first one
+            after the line and its following blank lines, greedy so the last one
+        """
+
+        eol = self.__eol(pos)
+        if not eol in self.__next_line_starts:
+            self.__next_line_starts[eol] = self.__space_re.match(data,eol).end()
+        next_start = self.__next_line_starts[eol]
+        if next_start in self.__array_def_ends:
+            return self.__array_def_ends[next_start]
+
+        i = bisect.bisect_left(self.__array_defs,eol)-1
+        if i >= 0 and self.__array_defs[i] >= pos:
+            return self.__array_def_ends[self.__array_defs[i]]
+        return None
+
+    def __match_function(self,data,pos):
+        """
+            Returns the end of the FUNCTION token starting at pos or None
+            Greedy (.*|) ends on the last valid ')' of the line of the '('
+        """
+
+        if self.__func_keyword_re.match(data,pos):
+            return None
+        if pos > 0 and self.__word_char_re.match(data,pos-1):
+            return None
+        m = self.__word_re.match(data,pos)
+        if not m:
+            return None
+
+        lparen = m.end()
+        if data[lparen:lparen+1] != "(":
+            if self.__space_char_re.match(data,lparen) and data[lparen+1:lparen+2] == "(":
+                lparen += 1
+            else:
+                return None
+
+        i = bisect.bisect_left(self.__rparens,self.__eol(lparen))-1
+        if i >= 0 and self.__rparens[i] > lparen:
+            return self.__rparens[i]+1
+        return None
+
+    def input(self,data):
+        """
+            Feeds data to the lexer and resets line and column state
         """
 
         self.lexer.input(data)
+        self.lexer.lineno = 1
+        self.__last_newline_lexpos = 0
+
+        if self.linear:
+            self.__linear_tables(data)
+        if self.scanner:
+            self.__scanner_tables(data)
+
+    def __master_token(self,data,pos):
+        """
+            Matches the ply master regex at pos, as ply token() does, but
+            returns None instead of lexing further when the rule discards
+            the token (newlines, errors)
+        """
+
+        if self.scanner:
+            return next(self.__scan_tokens)
+
+        lexer = self.lexer
+        tok = ply.lex.LexToken()
+        tok.lineno = lexer.lineno
+        tok.lexpos = pos
+        tok.lexer = lexer
+
+        for lexre, lexindexfunc in lexer.lexre:
+            m = lexre.match(data,pos)
+            if not m:
+                continue
+
+            tok.value = m.group()
+            func, tok.type = lexindexfunc[m.lastindex]
+            lexer.lexpos = m.end()
+            if not func:
+                self.__rule = "t_"+tok.type
+                return tok
+            self.__rule = func.__name__
+            lexer.lexmatch = m
+            return func(tok)
+
+        # no rule matched: t_ANY_error skips the character
+        self.__rule = "t_ANY_error"
+        tok.value = data[pos]
+        tok.type = "error"
+        lexer.lexpos = pos
+        return lexer.lexerrorf(tok)
+
+    def token(self):
+        """
+            Returns the next token
+            In linear mode the rules are tried in the same order as in the
+            master regex, LINEAR_RULES being matched from the input tables
+            With the scanner engine the master regex is matched by
+            __scan() instead of ply
+            In profile mode the matches and time of each rule are added
+            to rule_stats
+        """
+
+        lexer = self.lexer
+        data = lexer.lexdata
+
+        if not self.linear and not self.profile:
+            if self.scanner:
+                return next(self.__scan_tokens)
+            return self.lexer.token()
+
+        while True:
+            pos = lexer.lexpos
+            while pos < lexer.lexlen and data[pos] in self.t_ANY_ignore:
+                pos += 1
+            lexer.lexpos = pos
+            if pos >= lexer.lexlen:
+                return None
+
+            if self.profile:
+                start_time = timeit.default_timer()
+
+            end = None
+            if self.linear and not self.__string_init_re.match(data,pos):
+                type = "ARRAY_DEF"
+                end = self.__match_array_def(data,pos)
+                if end is None and not self.__sys_call_re.match(data,pos) and not self.__pragma_re.match(data,pos):
+                    type = "FUNCTION"
+                    end = self.__match_function(data,pos)
+
+            if end is None:
+                tok = self.__master_token(data,pos)
+            else:
+                self.__rule = "t_"+type
+                tok = ply.lex.LexToken()
+                tok.type = type
+                tok.value = data[pos:end]
+                tok.lineno = lexer.lineno
+                tok.lexpos = pos
+                tok.lexer = lexer
+                lexer.lexpos = end
+
+            if self.profile:
+                elapsed = timeit.default_timer()-start_time
+                if self.__rule in self.rule_stats:
+                    self.rule_stats[self.__rule][0] += 1
+                    self.rule_stats[self.__rule][1] += elapsed
+                else:
+                    self.rule_stats[self.__rule] = [1,elapsed]
+
+            if tok:
+                return tok
+
+
+    def iter_tokens(self):
+        """
+            Yields the tokens of the current input with their column
+        """
+
+        next_token = self.token
+        if self.scanner and not self.linear and not self.profile:
+            next_token = self.__scan_tokens.next
+
+        while True:
+            tok = next_token()
+            if not tok:
+                break
+            tok.column = tok.lexpos - self.__last_newline_lexpos
+            yield tok
+
+    def pop_rule_stats(self):
+        """
+            Returns the rule_stats gathered since the last call and resets them
+        """
 
-        self.is_exec_by_doors = False
-        self.include_dict = dict()
-        self.string_init_dict = dict()
-        self.string_init_loop_dict = dict()
-        self.pragma_dict = dict()
-        self.sys_call_dict = dict()
-        self.var_single_line_dict = dict()
+        stats = self.rule_stats
+        self.rule_stats = dict()
+        return stats
+
+    def __safe_boundary(self,window,toks,marks):
+        """
+            Returns the last position of window, with its line number, where
+            lexing can be cut without changing the tokens before it
+            That is a line start (after a newline outside comments and strings)
+            that no rule can reach from the previous line, and before the
+            first match attempt that may have needed data after the window
+        """
+
+        limit = self.__restart_limit(window,toks)
+        for pos, lineno in reversed(marks):
+            if pos > limit or pos >= len(window):
+                continue
+            if self.__is_restart_point(window,pos):
+                return pos, lineno
+
+        return None, None
+
+    def __restart_limit(self,window,toks):
+        """
+            Returns the position of the first match attempt among toks
+            (tokens of window) that may have needed data after the window
+        """
+
+        last_terminator = max([window.rfind(c) for c in ">;)+"])
+        for tok in toks:
+            # '/*' whose end is not in the window
+            if tok.type == "DIVIDE" and window[tok.lexpos+1:tok.lexpos+2] == "*":
+                return tok.lexpos
+            # INCLUDE_PATH attempt that found no end in the window
+            if tok.value[:1] == "<" and tok.type != "INCLUDE_PATH" and last_terminator < tok.lexpos+2:
+                return tok.lexpos
+
+        return len(window)
+
+    def __is_restart_point(self,data,pos):
+        """
+            Tells if lexing can restart at the line start pos (after a newline
+            outside comments and strings): no rule reaches it from the previous line
+        """
+
+        # line start not continuing a FUNCTION, ARRAY_DEF or SYS_CALL
+        c = data[pos]
+        if c.isspace() or c in "[({" or data.startswith("system",pos):
+            return False
+        # previous line not continued by STRING_INIT, ARRAY_DEF, PRAGMA or FUNCTION
+        i = pos-1
+        while i >= 0 and data[i].isspace():
+            i -= 1
+        if i >= 0 and (data[i].isalnum() or data[i] in "_=,]"):
+            return False
+        return True
+
+    def __chunk_tokens(self,data):
+        """
+            Yields the tokens of data (string or memory-mapped file) lexed by
+            windows of CHUNK_SIZE bytes, each one cut at its last safe boundary
+            A window without safe boundary is doubled and lexed again
+        """
+
+        size = len(data)
+        start = 0
+        lineno = 1
+        window_size = CHUNK_SIZE
+
+        while start < size:
+            end = data.find("\n",start+window_size)
+            if end == -1:
+                end = size
+            else:
+                end += 1
+
+            window = data[start:end]
+            self.input(window)
+            self.lexer.lineno = lineno
+            self.__newline_marks = []
+            toks = list(self.iter_tokens())
+            marks = self.__newline_marks
+            self.__newline_marks = None
+
+            if end == size:
+                boundary, boundary_lineno = len(window), None
+            else:
+                boundary, boundary_lineno = self.__safe_boundary(window,toks,marks)
+                if boundary is None:
+                    window_size *= 2
+                    continue
+
+            for tok in toks:
+                if tok.lexpos >= boundary:
+                    break
+                tok.lexpos += start
+                yield tok
+
+            start += boundary
+            lineno = boundary_lineno
+            window_size = CHUNK_SIZE
+
+    def analyse(self,data):
+        """
+            Single lexing pass over data
+            Returns an Analysis object holding every token of interest
+            for the checks in dxl_scan.py and the HTML rendering
+        """
+
+        self.input(data)
+        a = self.__analyse_tokens(self.iter_tokens(),self.Analysis(data))
+        a.nb_lines = data.count("\n")+1
+
+        return a
+
+    def analyse_file(self,dxl_file):
+        """
+            Same as analyse() on the content of dxl_file, memory-mapped and
+            lexed by chunks so that files of any size are analysed with
+            bounded memory
+        """
+
+        with open(dxl_file,"rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return self.analyse("")
+
+            data = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+            try:
+                a = self.__analyse_tokens(self.__chunk_tokens(data),self.Analysis(dxl_file=dxl_file))
+                a.size = len(data)
+                a.nb_lines = 1
+                for start in xrange(0,len(data),CHUNK_SIZE):
+                    a.nb_lines += data[start:start+CHUNK_SIZE].count("\n")
+            finally:
+                data.close()
+
+        return a
+
+    def __analyse_tokens(self,tokens,a):
+        """
+            Collects tokens of interest from a token stream into Analysis a
+        """
 
         previous_token_is_include = False
         previous_token_is_string_init = False
@@ -243,32 +953,31 @@ class Lexer:
         count_tok = 0
         is_first_token = False
 
-        # test get called function
-        keywords = ["BOOL","CHAR","INT","STRING","REAL","VOID","OBJECT","MODULE"]
-        self.func_called = []
+        # called functions
+        keywords = set(["BOOL","CHAR","INT","STRING","REAL","VOID","OBJECT","MODULE"])
         previous_token_is_keyword = False
 
+        # declared functions: return type keyword, name, parameter list, '{'
+        # decl_state: 0 none, 1 return type, 2 name, 3 parameters, 4 ')'
+        decl_state = 0
+        decl_name = None
+        decl_line = 0
+        decl_depth = 0
+
         has_loop = False
         in_loop = False
         count_brace = 0
 
-        while True:
-            tok = self.lexer.token()
-            if not tok:
-                break
+        for tok in tokens:
 
             # Include tokens
             if previous_token_is_include:
                 if tok.type in ["INCLUDE_PATH","SCONST"]:
-                    v = tok.value[1:-1]
-                    l = tok.lineno
-                    self.include_dict[v] = l
+                    a.include_dict[tok.value[1:-1]] = tok.lineno
 
             # String initialization tokens
             if previous_token_is_string_init:
-                v = tok.value
-                l = tok.lineno
-                self.string_init_dict[v] = l
+                a.string_init_dict[tok.value] = tok.lineno
 
             # String initialization in loop
             if tok.type in ["FOR","WHILE"]:
@@ -283,84 +992,111 @@ class Lexer:
                     has_loop = False
             if in_loop:
                 if tok.type == "STRING_INIT":
-                    v = tok.value
-                    l = tok.lineno
-                    self.string_init_loop_dict[v] = l
-
-            """# More than one instruction on a line
-            if tok.type == "VAR_SINGLE_LINE":
-                v = tok.value
-                l = tok.lineno
-                self.var_single_line_dict[v] = l"""
+                    a.string_init_loop_dict[tok.value] = tok.lineno
 
             # Pragma tokens
             if tok.type == "PRAGMA":
-                v = tok.value
-                l = tok.lineno
-                self.pragma_dict[v] = l
+                a.pragma_dict[tok.value] = tok.lineno
 
             # System calls tokens
             if tok.type == "SYS_CALL":
-                v = tok.value
-                l = tok.lineno
-                self.sys_call_dict[v] = l
+                a.sys_call_dict[tok.value] = tok.lineno
             if tok.type == "FUNCTION":
                 if tok.value[:6] == "system":
-                    v = tok.value
-                    l = tok.lineno
-                    self.sys_call_dict[v] = l
+                    a.sys_call_dict[tok.value] = tok.lineno
 
             # File executable by DOORS
             if tok.type == "CPP_COMMENT" and count_tok == 1:
                 is_first_token = True
             if previous_token_is_cpp_comment and is_first_token and tok.type == "C_COMMENT":
-                self.is_exec_by_doors = True
+                a.is_exec_by_doors = True
 
             # Called functions
             if tok.type == "FUNCTION" and not previous_token_is_keyword:
-                tok.value = tok.value.split("(")[0]
-                self.func_called.append(tok.value)
+                a.func_called.append(tok.value.split("(")[0])
+
+            # Declared functions
+            func_name = None
+            if decl_state == 1:
+                decl_state = 0
+                if tok.type == "ID":
+                    decl_state = 2
+                    decl_name = tok.value
+                    decl_line = tok.lineno
+                elif tok.type == "FUNCTION":
+                    # name and parameters up to a ')' not followed by '{'
+                    decl_name = tok.value.split("(")[0].rstrip()
+                    decl_line = tok.lineno
+                    decl_depth = tok.value.count("(") - tok.value.count(")")
+                    if "{" in tok.value:
+                        # body opened on the line of the parameters
+                        func_name = decl_name
+                    elif decl_depth > 0:
+                        decl_state = 3
+                    else:
+                        decl_state = 4
+            elif decl_state == 2:
+                decl_state = 0
+                if tok.type == "LPAREN":
+                    decl_state = 3
+                    decl_depth = 1
+            elif decl_state == 3:
+                if tok.type == "LPAREN":
+                    decl_depth += 1
+                elif tok.type == "RPAREN":
+                    decl_depth -= 1
+                elif tok.type == "FUNCTION":
+                    decl_depth += tok.value.count("(") - tok.value.count(")")
+                if decl_depth <= 0:
+                    decl_state = 4
+            elif decl_state == 4:
+                decl_state = 0
+                if tok.type == "LBRACE":
+                    func_name = decl_name
+            if func_name is not None:
+                if func_name in a.func_declarations_dict:
+                    a.func_declarations_dict[func_name].append(decl_line)
+                else:
+                    a.func_declarations_dict[func_name] = [decl_line]
+            if decl_state == 0 and tok.type in keywords:
+                decl_state = 1
 
             previous_token_is_include = tok.type == "INCLUDE"
             previous_token_is_string_init = tok.type == "STRING_INIT"
             previous_token_is_cpp_comment = tok.type == "CPP_COMMENT"
             previous_token_is_keyword = tok.type in keywords
 
+            # Tokens for HTML rendering
+            a.tokens.append_token(tok)
 
-    def get_func_declarations(self,data):
-        """
-            Returns a dictionnary of declared functions names as key
-            and a list of lines where they are declared as value
-        """
-
-        self.lexer.input(data)
-        func_name_dict = dict()
-        previous_token_is_keyword = False
-        keywords = ["BOOL","CHAR","INT","STRING","REAL","VOID","OBJECT","MODULE","SKIP"]
+        a.tokens.index_lines()
 
-        func_re = re.compile(r'(bool|char|int|string|real|void|Object|Module)[ \t]{1,}(?P<func_name>[\w]*)([ \t]|)\(.*\)(\s|){0,}\{([^\}]*|)\}')
-        func_names = [match.group('func_name') for match in func_re.finditer(data)]
+        return a
 
-        while True:
-            func_line_list = []
 
-            tok = self.lexer.token()
-            if not tok:
-                break
+    def get_tokens(self,data):
+        """
+            Gets tokens of interest to analyze them in dxl_scan.py
+        """
 
-            if tok.type == "FUNCTION" and previous_token_is_keyword:
-                tok.value = tok.value.split("(")[0]
+        a = self.analyse(data)
+        self.is_exec_by_doors = a.is_exec_by_doors
+        self.include_dict = a.include_dict
+        self.string_init_dict = a.string_init_dict
+        self.string_init_loop_dict = a.string_init_loop_dict
+        self.pragma_dict = a.pragma_dict
+        self.sys_call_dict = a.sys_call_dict
+        self.var_single_line_dict = a.var_single_line_dict
+        self.func_called = a.func_called
 
-            if tok.value in func_names:
-                if tok.value in func_name_dict:
-                    func_name_dict[tok.value].append(tok.lineno)
-                else:
-                    func_line_list.append(tok.lineno)
-                    func_name_dict[tok.value] = func_line_list
 
-            previous_token_is_keyword = tok.type in keywords
+    def get_func_declarations(self,data):
+        """
+            Returns a dictionnary of declared functions names as key
+            and a list of lines where they are declared as value
+        """
 
-        return func_name_dict
+        return self.analyse(data).func_declarations_dict
 
 
     def init(self,data):
@@ -370,32 +1106,308 @@ class Lexer:
             and a Token objects list as value
         """
 
-        self.lexer.input(data)
-        self.tok_dict = dict()
-        self.tok_list = []
-
-        while True:
-            tok = self.lexer.token()
-
-            if not tok:
-                break
+        self.__newline_marks = []
+        tokens = self.analyse(data).tokens
+        self.__init_marks = self.__newline_marks
+        self.__newline_marks = None
+        self.__init_data = data
+        self.__init_tokens = tokens
 
-            if tok.type == "CPP_COMMENT":
-                if tok.value.startswith("//#include") or tok.value.startswith("// #include"):
-                    tok.value = tok.value.replace("<","&lt").replace(">","&gt")
-            elif tok.type == "C_COMMENT":
-                tok.value = tok.value.replace("\n","<br>\n").replace("\t","&nbsp;"*8).replace(" ","&nbsp;")
-            elif tok.type == "NESTEDCODE":
-                tok.value = tok.value.replace("\n","<br>\n")#.replace("\t","&nbsp;"*8).replace(" ","&nbsp;"*2)
+        self.tok_dict = dict([(l, tokens.line_tokens(l)) for l in tokens.line_numbers()])
+        return self.tok_dict
 
-            # some SYS_CALL tokens are mistaken for FUNCTION ones
-            if tok.type == "FUNCTION":
-                if tok.value[:6] == "system":
-                    tok.type = "SYS_CALL"
+    def edit(self,start,end,text):
+        """
+            Replaces data[start:end] of the data given to init() by text
+            and lexes again from the last safe restart point before start
+            until a line start after the edit where the token stream
+            resynchronizes with the previous one
+            Patches and returns self.tok_dict
+        """
 
-            column = tok.lexpos - self.__last_newline_lexpos
-            if not tok.lineno in self.tok_dict:
-                self.tok_dict[tok.lineno] = []
+        data = self.__init_data
+        table = self.__init_tokens
+        marks = self.__init_marks
+        new_data = data[:start] + text + data[end:]
+        delta = len(text) - (end-start)
+        edit_end = start + len(text)
+
+        # restart point: a line start before the edit and before any
+        # match attempt that may have read the edited data
+        window = data[:start]
+        i = bisect.bisect_left(table.starts,start)
+        candidates = set()
+        types = table.types.tostring()
+        divide = chr(self.type_ids["DIVIDE"])
+        k = types.find(divide,0,i)
+        while k != -1:
+            candidates.add(k)
+            k = types.find(divide,k+1,i)
+        last_terminator = max([window.rfind(c) for c in ">;)+"])
+        candidates.update(xrange(bisect.bisect_left(table.starts,last_terminator-1),i))
+        toks = []
+        for k in sorted(candidates):
+            tok = ply.lex.LexToken()
+            tok.type = self.tokens[table.types[k]]
+            tok.value = table.value(k)
+            tok.lexpos = table.starts[k]
+            toks.append(tok)
+        limit = min(self.__restart_limit(window,toks),start)
+
+        restart, restart_lineno = 0, 1
+        for pos, lineno in reversed(marks[:bisect.bisect_right(marks,(limit,sys.maxint))]):
+            # no rule reached pos from the previous line, before and after the edit
+            if (pos == len(new_data) or self.__is_restart_point(new_data,pos)) and (pos == len(data) or self.__is_restart_point(data,pos)):
+                restart, restart_lineno = pos, lineno
+                break
 
-            t = self.Token(tok.value,tok.type,tok.lineno,column)
-            self.tok_dict[tok.lineno].append(t)
+        # lex until a new line start after the edit is an old line start
+        self.input(new_data)
+        self.lexer.lexpos = restart
+        self.lexer.lineno = restart_lineno
+        self.__last_newline_lexpos = restart
+        self.__newline_marks = []
+        new_marks = []
+        relexed = self.TokenTable(new_data)
+
+        def resync():
+            # (position, line, old mark index) of the first new line start
+            # after the edit which is an old line start, None if not lexed yet
+            while len(new_marks) < len(self.__newline_marks):
+                pos, lineno = self.__newline_marks[len(new_marks)]
+                new_marks.append((pos,lineno))
+                k = bisect.bisect_left(marks,(pos-delta,))
+                if pos >= edit_end and k < len(marks) and marks[k][0] == pos-delta:
+                    return pos, lineno, k
+            return None
+
+        sync = None
+        for tok in self.iter_tokens():
+            sync = resync()
+            if sync is not None:
+                break
+            relexed.append_token(tok)
+        if sync is None:
+            sync = resync()
+        self.__newline_marks = None
+
+        # patch the tokens, newline marks and tok_dict
+        i = bisect.bisect_left(table.starts,restart)
+        if sync is None:
+            j = len(table)
+            sync_line = None
+            line_delta = 0
+            tail_marks = []
+        else:
+            pos, lineno, k = sync
+            j = bisect.bisect_left(table.starts,pos-delta)
+            sync_line = marks[k][1]
+            line_delta = lineno - sync_line
+            tail_marks = [(pos+delta, lineno+line_delta) for pos, lineno in marks[k+1:]]
+
+        for l in set(table.lines[i:j]):
+            del self.tok_dict[l]
+        if line_delta != 0:
+            tail_lines = sorted([l for l in self.tok_dict if l >= sync_line])
+            tail = [(l, self.tok_dict.pop(l)) for l in tail_lines]
+            for l, line_toks in tail:
+                for token in line_toks:
+                    token.line += line_delta
+                self.tok_dict[l+line_delta] = line_toks
+
+        table.replace(i,j,relexed,restart_lineno,sync_line,delta,line_delta,new_data)
+        for l in set(relexed.lines):
+            self.tok_dict[l] = table.line_tokens(l)
+
+        self.__init_marks = marks[:bisect.bisect_right(marks,(restart,sys.maxint))] + new_marks + tail_marks
+        self.__init_data = new_data
+
+        return self.tok_dict
+
+
+def rules_hash(linear=False):
+    """
+        Returns the SHA-1 of what ply builds the lexing tables from: the
+        tokens, the literals and, for each t_ rule, its name, regex and
+        line, so that tables built from other rules are never read
+    """
+
+    rules = [ply.lex.__version__,linear,LINEAR_RULES,Lexer.tokens,getattr(Lexer,"literals",""),getattr(Lexer,"states",())]
+    for name in sorted(dir(Lexer)):
+        if name.startswith("t_"):
+            rule = getattr(Lexer,name)
+            if callable(rule):
+                rules.append((name,getattr(rule,"regex",rule.__doc__),rule.func_code.co_firstlineno))
+            else:
+                rules.append((name,rule))
+
+    return hashlib.sha1(repr(rules)).hexdigest()
+
+
+def get_lexer(optimize=False,linear=False,scanner=False,profile=False,lextab_dir=None):
+    """
+        Returns a clone of the process-wide Lexer, built on first call only
+        In optimize mode the lexing tables are read from the module written
+        in lextab_dir (default: the temporary directory) by the first run
+        with the same rules, so that ply skips the inspection of the rules.
+        In linear mode LINEAR_RULES are matched without regex backtracking.
+        With scanner the same tokens are produced by the scanner engine
+        instead of ply token().
+        In profile mode the lexer counts matches and time of each rule.
+    """
+
+    key = (bool(optimize),linear)
+    if not key in _shared_lexers:
+        lexer = Lexer(linear)
+        if optimize:
+            if lextab_dir is None:
+                lextab_dir = tempfile.gettempdir()
+            lextab = "%s_%s" % (LEXTAB,rules_hash(linear))
+            lextab_file = os.path.join(lextab_dir,lextab+".py")
+            if os.path.exists(lextab_file):
+                try:
+                    lextab = imp.load_source(lextab,lextab_file)
+                except Exception:
+                    # being written by another process, built again
+                    pass
+            lexer.build(optimize=True,lextab=lextab,outputdir=lextab_dir)
+        else:
+            lexer.build()
+        _shared_lexers[key] = lexer
+
+    lexer = _shared_lexers[key].clone()
+    lexer.scanner = scanner
+    lexer.profile = profile
+    return lexer
+
+
+def token_stream(lexer,data):
+    """
+        Returns the raw (type,value,line,position) tokens of data
+    """
+
+    lexer.input(data)
+    toks = []
+    while True:
+        tok = lexer.token()
+        if not tok:
+            break
+        toks.append((tok.type,tok.value,tok.lineno,tok.lexpos))
+    return toks
+
+
+def merge_rule_stats(total,stats):
+    """
+        Adds the rule_stats of a Lexer in profile mode to total
+    """
+
+    for rule, (matches, seconds) in stats.items():
+        if rule in total:
+            total[rule][0] += matches
+            total[rule][1] += seconds
+        else:
+            total[rule] = [matches,seconds]
+    return total
+
+
+def rule_stats_table(stats):
+    """
+        Returns rule_stats as a text table sorted by decreasing time
+    """
+
+    total_seconds = sum([seconds for matches, seconds in stats.values()])
+    lines = ["%-20s %10s %12s %10s %7s" % ("rule","matches","total ms","avg us","time %")]
+    for rule, (matches, seconds) in sorted(stats.items(),key=lambda item: item[1][1],reverse=True):
+        lines.append("%-20s %10d %12.3f %10.3f %7.2f" % (rule,matches,seconds*1000,seconds*1e6/max(matches,1),seconds*100/max(total_seconds,1e-9)))
+    return "\n".join(lines)+"\n"
+
+
+def first_chars(regex):
+    """
+        Returns the characters a match of regex can start with
+        Assertions are ignored and unknown constructs may start with any
+        character, so the set may be larger than the exact one
+    """
+
+    chars = set(map(chr,xrange(256)))
+    categories = dict([
+        (sre_constants.CATEGORY_DIGIT, r"\d"), (sre_constants.CATEGORY_NOT_DIGIT, r"\D"),
+        (sre_constants.CATEGORY_SPACE, r"\s"), (sre_constants.CATEGORY_NOT_SPACE, r"\S"),
+        (sre_constants.CATEGORY_WORD, r"\w"), (sre_constants.CATEGORY_NOT_WORD, r"\W")
+    ])
+
+    def first(items):
+        # (first characters, may match the empty string)
+        result = set()
+        for op, av in items:
+            if op == sre_constants.LITERAL:
+                f, nullable = set([chr(av)]), False
+            elif op == sre_constants.NOT_LITERAL:
+                f, nullable = chars - set([chr(av)]), False
+            elif op == sre_constants.ANY:
+                f, nullable = chars - set(["\n"]), False
+            elif op == sre_constants.IN:
+                f, nullable = set(), False
+                negate = False
+                for in_op, in_av in av:
+                    if in_op == sre_constants.NEGATE:
+                        negate = True
+                    elif in_op == sre_constants.LITERAL:
+                        f.add(chr(in_av))
+                    elif in_op == sre_constants.RANGE:
+                        f.update(map(chr,xrange(in_av[0],in_av[1]+1)))
+                    elif in_op == sre_constants.CATEGORY and in_av in categories:
+                        f.update([c for c in chars if re.match(categories[in_av],c)])
+                    else:
+                        f = set(chars)
+                if negate:
+                    f = chars - f
+            elif op == sre_constants.BRANCH:
+                f, nullable = set(), False
+                for branch in av[1]:
+                    branch_first, branch_nullable = first(branch)
+                    f |= branch_first
+                    nullable = nullable or branch_nullable
+            elif op == sre_constants.SUBPATTERN:
+                f, nullable = first(av[-1])
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                f, nullable = first(av[2])
+                nullable = nullable or av[0] == 0
+            elif op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+                f, nullable = set(), True
+            else:
+                f, nullable = set(chars), True
+
+            result |= f
+            if not nullable:
+                return result, False
+        return result, True
+
+    f, nullable = first(sre_parse.parse(regex,re.VERBOSE))
+    if nullable:
+        return chars
+    return f
+
+
+if __name__ == '__main__':
+    """
+        Checks linear mode and scanner engine parity with ply on the DXL
+        files given as arguments, see test_dxl_lexer.py for the generated
+        and edge-case inputs and dxl_bench.py for the timings
+    """
+
+    import sys
+
+    default_lexer = get_lexer()
+    linear_lexer = get_lexer(linear=True)
+    scanner_lexer = get_lexer(scanner=True)
+
+    for dxl_file in sys.argv[1:]:
+        with open(dxl_file) as f:
+            data = f.read()
+        toks = token_stream(default_lexer,data)
+        if toks == token_stream(linear_lexer,data) and toks == token_stream(scanner_lexer,data):
+            print "parity OK: %s" % dxl_file
+        else:
+            print "parity FAILED: %s" % dxl_file
+            sys.exit(1)
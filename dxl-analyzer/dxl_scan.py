@@ -11,13 +11,25 @@ import cPickle as pickle
 import re
 import collections
 import hashlib
+import shelve
 import operator
 import datetime
+import itertools
+import heapq
+import multiprocessing
+import threading
+import Queue
 
 # custom imports
 import python_lacks,project_config,text_progress_bar,drives
 import count_usage
-from dxl_lexer import Lexer
+from dxl_lexer import Lexer,get_lexer,merge_rule_stats,rule_stats_table
+import read_ahead
+import dir_walker
+import path_probe
+import dup_finder
+import analysis_cache
+import hash_store
 from template import Template
 
 try:
@@ -70,19 +82,45 @@ class DuplicateFileError():
         m = self.message+": "+self.file_path
         return m
 
-class OversizeFileError():
-    def __init__(self, message):
-        self.message = message
-
-    def __str__(self):
-        m = self.message
-        return m
-
 class DuplicateFunctionError(DuplicateFileError):
     def __init__(self, message, files):
         DuplicateFileError.__init__(self, message, files)
         DuplicateFileError.__str__(self)
 
+class FileResult:
+    """
+        Results of the checks of one DXL file and its includes, computed
+        from fresh state by any process and merged in file list order
+    """
+    def __init__(self, dxl_file):
+        self.dxl_file = dxl_file
+        self.errors = []
+        # (include, errors) for each valid include of the file
+        self.include_errors = []
+        self.valid_includes_dict = dict()
+        self.defined_functions_dict = dict()
+        self.called_functions = []
+        self.include_dict = dict()
+        self.nb_inc_dict = dict()
+        self.loc_dict = dict()
+        self.hash_content_dict = dict()
+        self.count_lines = 0
+        self.count_functions = 0
+        self.count_includes = 0
+        self.rule_stats = dict()
+        # DXL files whose HTML version must be rendered
+        self.pages = []
+        # seconds spent checking the file
+        self.seconds = 0
+        # (path, dup_finder.Fingerprints) of the file and of the includes
+        # first checked by the process
+        self.fingerprints = []
+        # page key of the file, its HTML version is rendered again when
+        # the key changes
+        self.page_keys = dict()
+        # path -> stamp and content hash of the files read by the process
+        self.file_hashes = dict()
+
 
 class ArgParser(object):
     def __init__(self, version):
@@ -286,6 +324,20 @@ class StartDoors:
         self.__ARG_PARSER.add_argument("scan-file=[]","scan the specified dxl file(s)",required=False)
         self.__ARG_PARSER.add_argument("complete","scan files and all includes from scratch; the last result directory is saved",required=False)
         self.__ARG_PARSER.add_argument("output=","custom location for results directory, default to CODE/DOORS_TOOLS/dxl_scan_result",required=False)
+        self.__ARG_PARSER.add_argument("lextab","read the lexer tables written in the cache of the output directory by the first run with the same rules, to skip their inspection at startup",short_opt="l",required=False)
+        self.__ARG_PARSER.add_argument("linear-lexing","match FUNCTION and ARRAY_DEF tokens in linear time (same tokens, no regex backtracking on long lines)",short_opt="L",required=False)
+        self.__ARG_PARSER.add_argument("scanner","lex with the scanner engine instead of ply token() (same tokens, no rule callbacks)",short_opt="S",required=False)
+        self.__ARG_PARSER.add_argument("profile-lexer","log matches and time of each lexer rule per file and for the whole scan",short_opt="P",required=False)
+        self.__ARG_PARSER.add_argument("jobs=","number of processes checking files (default: 1)",short_opt="j",required=False,default="1")
+        self.__ARG_PARSER.add_argument("read-ahead=","number of DXL files read ahead of their checks by a pool of threads (default: 0, no read-ahead)",short_opt="r",required=False,default="0")
+        self.__ARG_PARSER.add_argument("read-ahead-bytes=","maximum bytes of files read ahead (default: %d)" % read_ahead.MAX_BYTES,short_opt="R",required=False,default=str(read_ahead.MAX_BYTES))
+        self.__ARG_PARSER.add_argument("window=","maximum number of files checked ahead of the merge of their results, that bounds the memory of the scan (default: 512)",short_opt="w",required=False,default="512")
+        self.__ARG_PARSER.add_argument("no-render","check files only, without rendering their HTML versions in dxl_files",short_opt="n",required=False)
+        self.__ARG_PARSER.add_argument("shard=","check only the i-th of N parts of the files (i/N, from 1/N to N/N) and save the results for --merge",short_opt="x",required=False)
+        self.__ARG_PARSER.add_argument("concurrent-menus","build the trees and check the files of projects and addins at the same time, each with its own --jobs processes",short_opt="M",required=False)
+        self.__ARG_PARSER.add_argument("merge=","merge the results saved by the N shards of --shard i/N in the output directory and generate the reports",required=False)
+        self.__ARG_PARSER.add_argument("force-hash","read and hash every file, even the ones whose size, modification time and id did not change since the previous scan",short_opt="f",required=False)
+        self.__ARG_PARSER.add_argument("minimum-tokens=","minimum number of tokens of the code duplications reported (default: %d)" % dup_finder.MIN_TOKENS,short_opt="t",required=False,default=str(dup_finder.MIN_TOKENS))
 
     # not working/blocks. Better use network_specifics.get_memory and check for 0
     #def __still_alive(self):
@@ -296,82 +348,44 @@ class StartDoors:
         """
             Scan directories, subdirectories and files recursively
             and returns them in a nested dictionnary
+
+            Directories are listed concurrently by dir_walker, and the size
+            and modification time of each file are kept in self.__file_stats
         """
 
         dir_path = {}
         root_dir = root_dir.rstrip(os.sep)
-        start = root_dir.rfind(os.sep) + 1
 
-        for path, dirs, files in os.walk(root_dir):
-            if path.startswith("K"):
-                folders = path[start:].split(os.sep)
-                if folders[0] == os.path.basename(root_dir):
-                    folders[0] = root_dir
+        if not root_dir.startswith("K"):
+            return dir_path
 
-                subdir = {}
-                for file in files:
-                    subdir[file] = path+os.sep+file
-
-                # Better alternative to reduce(): parent = reduce(dict.get, folders[:-1], dir_path)
-                parent = dir_path
-                for folder in folders[:-1]:
-                    parent = dict.get(parent, folder)
-
-                parent[folders[-1]] = subdir
+        listing = dir_walker.walk(root_dir)
+        if root_dir in listing:
+            dir_path[root_dir] = self.__make_subtree(root_dir,listing)
 
         return dir_path
 
 
-    def __make_tree_new(self, root_dir):
+    def __make_subtree(self, path, listing):
         """
-            Same as __make_tree but NOT WORKING
+            Returns the nested dictionnary of directory path from the
+            listing of dir_walker.walk(), with the files and subdirectories
+            in the order os.walk() inserted them
         """
 
-        dir_path = {}
-        root_dir = root_dir.rstrip(os.sep)
-        start = root_dir.rfind(os.sep) + 1
-
-        import find
-        import collections
-        f = find.Find()
-        filelist = f.init(root_dir,type_list=["f"])
-        pathdict = collections.OrderedDict()
-        for f in filelist:
-            path = os.path.dirname(f)
-            name = os.path.basename(f)
-
-            the_path = path
-            while not the_path in pathdict:
-                print the_path
-                pathdict[the_path] = []
-                the_path = os.path.dirname(the_path).rstrip(os.sep)
-                if the_path=="":
-                    break
-            pathdict[path].append(name)
-
-        for path,files in pathdict.iteritems():
-            if path.startswith("K"):
-                folders = path[start:].split(os.sep)
-                if folders[0] == os.path.basename(root_dir):
-                    folders[0] = root_dir
-
-                subdir = {}
-                for file in files:
-                    subdir[file] = path+os.sep+file
-
-                a = folders[:-1]
-                b = dir_path
-                print "FFFFFF",a,b
-                parent = reduce(dict.get, a, b)
-                print parent
-                if parent==None:
-                    pass
-                    #raise Exception("parent = none: ",path,subdir,folders[:-1])
-                else:
-                    print "PARENT NOT NONE"
-                    print parent
-                    parent[folders[-1]] = subdir
-        return dir_path
+        files, dirs = listing[path]
+
+        subdir = {}
+        for file, size, mtime in files:
+            subdir[file] = path+os.sep+file
+            self.__file_stats[subdir[file]] = (size,mtime)
+
+        for folder in dirs:
+            folder_path = os.path.join(path,folder)
+            if folder_path in listing:
+                subdir[folder] = self.__make_subtree(folder_path,listing)
+
+        return subdir
 
 
     def __save_tree(self, txt_filename, dxl_menu):
@@ -382,8 +396,9 @@ class StartDoors:
 
         import time
         start_time = time.time()
+        self.__trees[txt_filename] = pickle.dumps([self.__make_tree(m) for m in dxl_menu])
         with open(txt_filename,"wb") as f:
-            pickle.dump([self.__make_tree(m) for m in dxl_menu],f)
+            f.write(self.__trees[txt_filename])
         #print "ELAPSED TIME : ", start_time-time.time()
 
 
@@ -405,7 +420,7 @@ class StartDoors:
                     #check hash first with path
                     html_file = self.__get_hash(v)+"_"+os.path.basename(v)
                     # if executable by DOORS, display file
-                    is_exec_by_doors = self.__file_exec_by_doors(v, self.__get_dxl_content(v))
+                    is_exec_by_doors = self.__file_exec_by_doors(v)
 
                     if is_exec_by_doors:
                         file.write("<li style='list-style-type: none;'>&#9492;&#9472; <a href='dxl_files/"+html_file.replace(" ","%20")+".html'>")
@@ -463,10 +478,15 @@ class StartDoors:
         """
             Calls dict2list() to loop over each nested dictionnary
             and returns a list of DXL files
+            Trees saved by this process are not read again, as shards
+            started at the same time may be writing them
         """
 
-        with open(txt_filename,"rb") as f:
-            dict_list = pickle.load(f)
+        if txt_filename in self.__trees:
+            dict_list = pickle.loads(self.__trees[txt_filename])
+        else:
+            with open(txt_filename,"rb") as f:
+                dict_list = pickle.load(f)
 
         dxl_files_list = []
         for dict_obj in dict_list:
@@ -486,6 +506,102 @@ class StartDoors:
         return data
 
 
+    def __analyse(self, dxl_file, data=None):
+        """
+            Lexes DXL file once and returns the Lexer.Analysis
+            shared by every check and by the HTML rendering
+            data is the content of the file when already read
+        """
+
+        if data is None:
+            analysis = self.__lexer.analyse_file(dxl_file)
+        else:
+            analysis = self.__lexer.analyse(data)
+        if self.__profile_lexer:
+            merge_rule_stats(self.__rule_stats,self.__lexer.pop_rule_stats())
+        return analysis
+
+
+    def __get_lexer(self):
+        """
+            Returns the lexer of the options of the scan, whose --lextab
+            tables are written in the cache of the output directory
+        """
+
+        return get_lexer(optimize=self.__lextab,linear=self.__linear_lexing,scanner=self.__scanner,profile=self.__profile_lexer,lextab_dir=self.__output_dir+"/cache")
+
+
+    def __open_analysis_cache(self):
+        """
+            Returns the cache of the summaries of the analyses of the
+            previous scans
+        """
+
+        return analysis_cache.AnalysisCache(self.__output_dir+"/cache","%d_%s" % (analysis_cache.VERSION,self.__minimum_tokens))
+
+
+    def __content_hash(self, dxl_file, data=None):
+        """
+            Returns the SHA-1 of the content of DXL file, read once by
+            this process, data is the content when already read
+
+            Files whose stamp (size, modification time and id) is the one
+            kept by the previous scans are not read, unless --force-hash or
+            --complete, nor the ones read by the workers of this scan: their
+            hash is the one kept with the stamp. Stamps of the files read
+            are kept in self.__file_hashes.
+        """
+
+        if not dxl_file in self.__content_hashes:
+            if data is None:
+                st = os.stat(dxl_file)
+                stamp = hash_store.file_stamp(st)
+                # stamps of the files read by the workers of this scan, or
+                # else of the previous scans
+                stored = self.__file_hashes.get(dxl_file)
+                if stored is None and not self.__force_hash and not self.__complete:
+                    stored = self.__hash_store.get("file_hashes",dxl_file)
+                if stored is not None and stored.rsplit(" ",1)[0] == stamp:
+                    content_hash = stored.rsplit(" ",1)[1]
+                else:
+                    hash_time = time.time()
+                    sha1 = hashlib.sha1()
+                    with open(dxl_file,"rb") as f:
+                        for block in iter(lambda: f.read(1024*1024),""):
+                            sha1.update(block)
+                    content_hash = sha1.hexdigest()
+                    if hash_time-st.st_mtime > hash_store.RACY_SECONDS:
+                        self.__file_hashes[dxl_file] = stamp+" "+content_hash
+                self.__content_hashes[dxl_file] = content_hash
+            else:
+                self.__content_hashes[dxl_file] = self.__get_hash(data)
+
+        return self.__content_hashes[dxl_file]
+
+
+    def __summarize(self, dxl_file, data=None):
+        """
+            Returns the analysis_cache.Summary of DXL file, from the cache
+            if its content was analysed before, or else lexed once and
+            added to the cache
+            data is the content of the file when already read
+        """
+
+        content_hash = self.__content_hash(dxl_file,data)
+
+        summary = None
+        if not self.__complete:
+            summary = self.__analysis_cache.get(content_hash)
+
+        if summary is None:
+            analysis = self.__analyse(dxl_file,data)
+            summary = analysis_cache.Summary(content_hash,analysis,dup_finder.fingerprint(analysis.tokens,int(self.__minimum_tokens)))
+            analysis.tokens.close()
+            self.__analysis_cache.put(summary)
+
+        return summary
+
+
     def __write_list_files(self, f, embedded):
         """
             Writes an HTML list of files, without header if embedded in homepage
@@ -502,6 +618,14 @@ class StartDoors:
         f.write("<table style='width:100%; background:#FFF;'>")
         f.write("<tr><th>Filename</th><th>Issues</th><th>Includes</th><th>Last analysis</th><th>Lines of code</th></tr>")
 
+        # modification times of the HTML versions from a single listing
+        # of dxl_files rather than one call per row
+        page_mtimes = dict()
+        listing = dir_walker.list_dir(self.__output_dir+os.sep+"dxl_files")
+        if listing is not None:
+            for name, size, mtime in listing[0]:
+                page_mtimes[name] = mtime
+
         for filename in sorted(self.__hash_file_dict.items(), key=operator.itemgetter(1)):
             file_with_hash = filename[0]
             file_link_to_display = filename[1].replace(".html","")
@@ -523,7 +647,7 @@ class StartDoors:
                 abs_file_path = match_abs_file_path.group(0).lstrip("notepad++ ")
 
             nb_err = "-"
-            if abs_file_path in self.__report.keys():
+            if abs_file_path in self.__report:
                 nb_err = str(len(self.__report[abs_file_path]))
 
             nb_inc = "-"
@@ -534,7 +658,10 @@ class StartDoors:
             f.write("<tr id='tr-list'>")
             # display filename without hash and html extension
             link = "dxl_files"+os.sep+file_with_hash
-            last_analysis_date = datetime.datetime.fromtimestamp(os.path.getmtime(self.__output_dir+os.sep+link)).strftime("%d/%m/%y - %H:%M")
+            mtime = page_mtimes.get(file_with_hash)
+            if mtime is None:
+                mtime = os.path.getmtime(self.__output_dir+os.sep+link)
+            last_analysis_date = datetime.datetime.fromtimestamp(mtime).strftime("%d/%m/%y - %H:%M")
 
             f.write("<td><a href='"+link+"'>"+file_link_to_display+"</a></td>")
             f.write("<td>"+str(nb_err)+"</td>")
@@ -588,117 +715,100 @@ class StartDoors:
             Add errors to list
         """
 
-        if dxl_file not in self.__report:
-            self.__report[dxl_file] = []
-        self.__report[dxl_file].append(e)
+        errors = self.__report.get(dxl_file,[])
+        errors.append(e)
+        self.__report[dxl_file] = errors
 
 
-    def __get_valid_includes(self ,dxl_file, dxl_content, log_error):
+    def __include_candidates(self, path):
+        """
+            Returns the paths where an include may be found, in priority
+            order: the path itself if absolute, otherwise in the first
+            DOORS path, in the DOORS lib directory, then in the other DOORS paths
+        """
+
+        if os.path.isabs(path):
+            return [path]
+
+        start_doors_ini_paths = self.__addin_dirs + self.__project_dirs
+        doors_includes_path = "D:/AppX64/IBM/Rational/DOORS/9.6/lib/dxl"
+
+        candidates = []
+        for start_path in start_doors_ini_paths:
+            candidates.append(os.path.normpath(os.path.join(start_path,path)))
+            if len(candidates) == 1:
+                candidates.append(os.path.normpath(os.path.join(doors_includes_path,path)))
+
+        return candidates
+
+
+    def __get_valid_includes(self ,dxl_file, analysis, log_error):
         """
             Validates includes from lexer function
             Outputs to error report and/or HTML version of DXL file
+
+            The candidate paths of all the includes are tested concurrently
         """
 
-        start_doors_ini_paths = self.__addin_dirs + self.__project_dirs
         exists_path_list = set()
 
-        fs = os.path.getsize(dxl_file)
-        if fs>500*1000:
-            pass
-        else:
-            self.__lexer.lexer.lineno = 1
-            self.__lexer.get_tokens(dxl_content)
-            include_dict = self.__lexer.include_dict
-
-            for path, line in include_dict.iteritems():
-                if path.startswith("\\"):
-                    path = path.lstrip("\\")
-                found = False
-                if os.path.isabs(path):
-                    # absolute path
-                    if os.path.exists(path):
-                        exists_path_list.add(path)
-                        found = True
-                else:
-                    # relative path: search in DOORS paths
-                    for start_path in start_doors_ini_paths:
-                        fp = os.path.join(start_path,path)
-                        fp = os.path.normpath(fp)
-                        if os.path.exists(fp):
-                            exists_path_list.add(fp)
-                            found = True
-                            break
-                        else:
-                            doors_includes_path = "D:/AppX64/IBM/Rational/DOORS/9.6/lib/dxl"
-                            c_path = os.path.join(doors_includes_path, path)
-                            c_path = os.path.normpath(c_path)
-                            if os.path.exists(c_path):
-                                exists_path_list.add(c_path)
-                                found = True
-                                break
-                if not found:
-                    # DOORS relative paths
-                    if not path.startswith(("utils","%%Path%%","%%templatePath%%")):
-                        if log_error:
-                            self.__add_error(dxl_file,IncludeError(path,"Path not found or not valid",line))
-
-            valid_includes_list = []
-            for path in exists_path_list:
-                t = None
-                #if "\\" in path:
-                #    t = "backslash"
-                if "\\\\" in path:
-                    t = "Double Backslash"
-                if t != None:
-                    if log_error:
-                        self.__add_error(dxl_file,IncludeError(path,t,line))
-
-                drive = os.path.splitdrive(path)[0]
-                if drive in ["K:","D:"]:
-                    valid_includes_list.append(path)
-                #R: paths illegal, but allow in valid_includes_list for hyperlink in HTML
-                elif drive == "R:":
-                    valid_includes_list.append(path)
-                    if log_error:
-                        self.__add_error(dxl_file,IncludeError(path,"Illegal path",line))
-                else:
+        include_dict = analysis.include_dict
+
+        paths = [path.lstrip("\\") for path in include_dict]
+        found_list = self.__path_probe.first_existing([self.__include_candidates(path) for path in paths])
+
+        for path, line, found_path in zip(paths,include_dict.values(),found_list):
+            if found_path is not None:
+                exists_path_list.add(found_path)
+            else:
+                # DOORS relative paths
+                if not path.startswith(("utils","%%Path%%","%%templatePath%%")):
                     if log_error:
-                        self.__add_error(dxl_file,IncludeError(path,"Illegal path",line))
+                        self.__add_error(dxl_file,IncludeError(path,"Path not found or not valid",line))
+
+        valid_includes_list = []
+        for path in exists_path_list:
+            t = None
+            #if "\\" in path:
+            #    t = "backslash"
+            if "\\\\" in path:
+                t = "Double Backslash"
+            if t != None:
+                if log_error:
+                    self.__add_error(dxl_file,IncludeError(path,t,line))
+
+            drive = os.path.splitdrive(path)[0]
+            if drive in ["K:","D:"]:
+                valid_includes_list.append(path)
+            #R: paths illegal, but allow in valid_includes_list for hyperlink in HTML
+            elif drive == "R:":
+                valid_includes_list.append(path)
+                if log_error:
+                    self.__add_error(dxl_file,IncludeError(path,"Illegal path",line))
+            else:
+                if log_error:
+                    self.__add_error(dxl_file,IncludeError(path,"Illegal path",line))
 
-            self.__valid_includes_dict[dxl_file] = valid_includes_list
+        self.__valid_includes_dict[dxl_file] = valid_includes_list
 
 
-    def __check_sys_calls(self,dxl_file,dxl_content):
+    def __check_sys_calls(self,dxl_file,analysis):
         """
             Outputs system calls from lexer function to error report
         """
 
-        fs = os.path.getsize(dxl_file)
-        if fs>500*1000:
-            pass
-        else:
-            self.__lexer.lexer.lineno = 1
-            self.__lexer.get_tokens(dxl_content)
-            sys_call_dict = self.__lexer.sys_call_dict
+        sys_call_dict = analysis.sys_call_dict
 
-            for sys_call, line in sys_call_dict.iteritems():
-                self.__add_error(dxl_file,FunctionError(sys_call,"System Call",line))
+        for sys_call, line in sys_call_dict.iteritems():
+            self.__add_error(dxl_file,FunctionError(sys_call,"System Call",line))
 
 
-    def __get_func_declarations(self,dxl_file,dxl_content):
+    def __get_func_declarations(self,dxl_file,analysis):
         """
             Gets function names declarations
         """
 
-        func_declarations_dict = dict()
-        fs = os.path.getsize(dxl_file)
-        if fs>500*1000:
-            pass
-        else:
-            self.__lexer.lexer.lineno = 1
-            func_declarations_dict = self.__lexer.get_func_declarations(dxl_content)
-
-        return func_declarations_dict
+        return analysis.func_declarations_dict
 
     """def __get_functions_duplications(self,dxl_file,dxl_content):
         func_declarations_dict = self.__get_func_declarations(dxl_file,dxl_content)
@@ -708,7 +818,7 @@ class StartDoors:
                     self.__add_error(dxl_file,FunctionError(func_name,"Function defined more than once with the same name",str(lines_list).strip('[]')))
     """
 
-    def __get_defined_functions(self,dxl_file,dxl_content):
+    def __get_defined_functions(self,dxl_file):
         """
             Gets defined functions in all files
         """
@@ -721,14 +831,12 @@ class StartDoors:
                 self.__defined_functions_dict[function_def].append(dxl_file)
 
 
-    def __get_called_functions(self,dxl_file,dxl_content):
+    def __get_called_functions(self,dxl_file,analysis):
         """
             Gets called functions in all files
         """
 
-        #called_func_list = self.__lexer.get_called_functions(dxl_content)
-        self.__lexer.get_tokens(dxl_content)
-        called_func_list = self.__lexer.func_called
+        called_func_list = analysis.func_called
         # discriminate DXL builtin functions
         """for called_func in called_func_list:
             if self.__builtin_fcts_dict.has_key(called_func):
@@ -773,164 +881,143 @@ class StartDoors:
             #    self.__add_error("Function "+defined_func+" defined but never called in",FunctionError(str(dxl_file_list_html).strip("['\n]"),"Function defined but never called",0))
 
 
-    def __file_exec_by_doors(self,dxl_file,dxl_content):
+    def __file_exec_by_doors(self,dxl_file):
         """
-            Checks if file is executable by DOORS by verifying comments in file
-            and filename in the .idx file in the same directory
+            Checks if file is executable by DOORS by verifying filename in
+            the .idx files in the same directory, or else comments in file
         """
 
-        is_exec_by_doors = False
+        if self.__extra_directory:
+            for extra_dir in self.__extra_directory:
+                if os.path.normpath(dxl_file).startswith(os.path.normpath(extra_dir)):
+                    return True
 
-        fs = os.path.getsize(dxl_file)
-        if fs>500*1000:
-            pass
-        else:
-            self.__lexer.lexer.lineno = 1
-            self.__lexer.get_tokens(dxl_content)
-            is_exec_by_doors = self.__lexer.is_exec_by_doors
+        file_dir, filename = os.path.split(dxl_file)
+        if os.path.splitext(filename)[0] in self.__idx_names(file_dir):
+            return True
 
-            if self.__extra_directory:
-                for extra_dir in self.__extra_directory:
-                    if os.path.normpath(dxl_file).startswith(os.path.normpath(extra_dir)):
-                        is_exec_by_doors = True
+        return self.__summarize(dxl_file).is_exec_by_doors
 
-            # check if a .idx file is present in dxl file dir
-            file_dir = os.path.dirname(dxl_file)
+
+    def __idx_names(self,file_dir):
+        """
+            Returns the set of the names (without extension) of the DXL files
+            of directory file_dir found in its .idx files, read once per
+            directory by the scan
+        """
+
+        if not file_dir in self.__idx_names_dict:
             list_files = os.listdir(file_dir)
 
+            idx_contents = []
             for filename in list_files:
                 if os.path.splitext(filename)[-1] == ".idx":
                     with open(file_dir+os.sep+filename) as f:
-                        data = f.read()
-                        if os.path.splitext(os.path.basename(dxl_file))[0] in data:
-                            is_exec_by_doors = True
+                        idx_contents.append(f.read())
+
+            names = set()
+            if idx_contents:
+                for filename in list_files:
+                    name, ext = os.path.splitext(filename)
+                    if ext == ".dxl" and [1 for data in idx_contents if name in data]:
+                        names.add(name)
+            self.__idx_names_dict[file_dir] = names
 
-        return is_exec_by_doors
+        return self.__idx_names_dict[file_dir]
 
 
-    def __check_string_init(self,dxl_file,dxl_content):
+    def __check_string_init(self,dxl_file,analysis):
         """
             Checks string initialisations arguments
         """
 
-        fs = os.path.getsize(dxl_file)
-        if fs>500*1000:
-            pass
-        else:
-            self.__lexer.lexer.lineno = 1
-            self.__lexer.get_tokens(dxl_content)
-            string_init_dict = self.__lexer.string_init_dict
-            string_init_loop_dict = self.__lexer.string_init_loop_dict
+        string_init_dict = analysis.string_init_dict
+        string_init_loop_dict = analysis.string_init_loop_dict
 
-            """for line in string_init_loop_dict.values():
-                self.__add_error(dxl_file,Error("String initialization","in loop",line))"""
+        """for line in string_init_loop_dict.values():
+            self.__add_error(dxl_file,Error("String initialization","in loop",line))"""
 
-            for token, line in string_init_dict.items():
-                if token == "null":
-                    self.__add_error(dxl_file,Error("Bad string initialization","Use \"\" instead of null",line))
+        for token, line in string_init_dict.items():
+            if token == "null":
+                self.__add_error(dxl_file,Error("Bad string initialization","Use \"\" instead of null",line))
 
 
-    def __check_pragmas(self,dxl_file,dxl_content):
+    def __is_error_pragma(self,analysis):
         """
-            Checks pragma arguments
+            Returns True if pragmas are missing or defined after includes
         """
 
-        self.__is_error_pragma = False
-        fs = os.path.getsize(dxl_file)
-        if fs>500*1000:
-            pass
+        is_error_pragma = False
+        pragma_dict = analysis.pragma_dict
+        include_dict = analysis.include_dict
+
+        # Check pragmas (defined, before includes, correct args)
+        #for include_dict in include_list:
+        # if includes found, get line of first include seen
+        if include_dict:
+            first_include_line = min(include_dict.values())
+        # no include in file
         else:
-            self.__lexer.lexer.lineno = 1
-            self.__lexer.get_tokens(dxl_content)
-            pragma_dict = self.__lexer.pragma_dict
-
-            # new instance of Lexer needed for getting
-            # correct token lines
-            lexer = Lexer()
-            lexer.build()
-            lexer.get_tokens(dxl_content)
-            include_dict = self.__lexer.include_dict
-
-            # Check pragmas (defined, before includes, correct args)
-            #for include_dict in include_list:
-            # if includes found, get line of first include seen
-            if include_dict:
-                first_include_line = min(include_dict.values())
-            # no include in file
-            else:
-                first_include_line = 0
+            first_include_line = 0
 
-            #for pragma_dict in self.__pragma_list:
-            # if pragma found, get line of last pragma
-            if pragma_dict:
-                last_pragma_line = max(pragma_dict.values())
-            # no pragma in file
-            else:
-                last_pragma_line = 0
+        #for pragma_dict in self.__pragma_list:
+        # if pragma found, get line of last pragma
+        if pragma_dict:
+            last_pragma_line = max(pragma_dict.values())
+        # no pragma in file
+        else:
+            last_pragma_line = 0
 
-            # if includes and pragma in file
-            if first_include_line != 0 and last_pragma_line != 0:
-                # if pragma after include => error
-                if last_pragma_line > first_include_line:
-                    #self.__add_error(dxl_file,PragmaError("Pragma","Must be defined before includes",last_pragma_line))
-                    self.__is_error_pragma = True
-            # if no pragma
-            elif first_include_line != 0 and last_pragma_line == 0:
-                pragma_tok = "pragma runLim, 0"
-                #self.__add_error(dxl_file,PragmaError(pragma_tok,"Not defined",last_pragma_line))
-                self.__is_error_pragma = True
+        # if includes and pragma in file
+        if first_include_line != 0 and last_pragma_line != 0:
+            # if pragma after include => error
+            if last_pragma_line > first_include_line:
+                #self.__add_error(dxl_file,PragmaError("Pragma","Must be defined before includes",last_pragma_line))
+                is_error_pragma = True
+        # if no pragma
+        elif first_include_line != 0 and last_pragma_line == 0:
+            pragma_tok = "pragma runLim, 0"
+            #self.__add_error(dxl_file,PragmaError(pragma_tok,"Not defined",last_pragma_line))
+            is_error_pragma = True
 
-            # check pragma args
-            #for pragma_dict in self.__pragma_list:
-            for pragma, line in pragma_dict.iteritems():
-                if "xflags" in pragma:
-                    self.__add_error(dxl_file,PragmaError(pragma,"Pragma xflags forbidden",line))
-                elif "runLim" in pragma:
-                    exec_cyc = int(pragma.split(",")[1])
-                    if exec_cyc != 0:
-                        self.__add_error(dxl_file,PragmaError(pragma,"Execution cycle not 0",line))
+        return is_error_pragma
 
 
-    def __check_duplicates(self,dxl_file_checking,dxl_files_list):
+    def __check_pragmas(self,dxl_file,analysis):
         """
-            Returns duplicate files (same name, whatever content) in a list
+            Checks pragma arguments
         """
 
-        dxl_basename_list = []
+        pragma_dict = analysis.pragma_dict
 
-        dxl_file_checking_basename = os.path.basename(dxl_file_checking)
+        # check pragma args
+        #for pragma_dict in self.__pragma_list:
+        for pragma, line in pragma_dict.iteritems():
+            if "xflags" in pragma:
+                self.__add_error(dxl_file,PragmaError(pragma,"Pragma xflags forbidden",line))
+            elif "runLim" in pragma:
+                exec_cyc = int(pragma.split(",")[1])
+                if exec_cyc != 0:
+                    self.__add_error(dxl_file,PragmaError(pragma,"Execution cycle not 0",line))
 
-        # get dxl files basenames
-        for dxl_file in dxl_files_list:
-            dxl_file_basename = os.path.basename(dxl_file)
-            dxl_basename_list.append(dxl_file_basename)
-
-        # get duplicate file names
-        dup_file_list = [k for k,v in collections.Counter(dxl_basename_list).items() if v>1]
 
-        # retrieve abs path of duplicate files
-        for dup_file in dup_file_list:
-            dup_file_path_list = []
-            # find dxl_file with same name
-            for dxl_file in dxl_files_list:
-                if dup_file == os.path.basename(dxl_file):
-                    dup_file_path_list.append(dxl_file)
+    def __check_duplicates(self,dxl_file_checking):
+        """
+            Reports duplicate files (same name, whatever content)
+            from the files by basename of __check_files()
+        """
 
-            # if current dxl_file is in duplicates list
-            # return the other duplicate files
-            if dxl_file_checking in dup_file_path_list:
-                for dup_path in dup_file_path_list:
-                    if dup_path != dxl_file_checking:
-                        self.__add_error(dxl_file_checking,DuplicateFileError("Same filename",dup_path))
+        for dup_path in self.__dxl_basenames[os.path.basename(dxl_file_checking)]:
+            if dup_path != dxl_file_checking:
+                self.__add_error(dxl_file_checking,DuplicateFileError("Same filename",dup_path))
 
 
     def __check_same_include_content(self):
         """
-            Returns duplicate include (whatever name but same content) from hash_content.txt
+            Returns duplicate include (whatever name but same content) from the hashes of the includes
         """
 
-        with open(self.__output_dir+"/txt/hash_content.txt","rb") as f:
-            hash_content_dict = pickle.load(f)
+        hash_content_dict = self.__hash_content_dict
 
         hash_content_list = []
         for hash_value in hash_content_dict.values():
@@ -1124,42 +1211,35 @@ class StartDoors:
             Store hash content of file in a dict and returns it
         """
 
-        file_content = self.__get_dxl_content(dxl_file)
-        hash_content = self.__get_hash(file_content)
+        hash_content = self.__content_hash(dxl_file)
 
         self.__hash_content_dict[dxl_file] = hash_content
 
-        with open(self.__output_dir+"/txt/hash_content.txt","wb") as f:
-            pickle.dump(self.__hash_content_dict,f)
-
         return hash_content
 
 
     def __compare_hash_content(self,dxl_file,current_hash):
         """
             Compares hash given in parameter with hash stored in dict
+            by the current file checks, or else by the previous scan
         """
 
-        with open(self.__output_dir+"/txt/hash_content.txt","rb") as f:
-            hash_content_dict = pickle.load(f)
-
-        if current_hash == hash_content_dict[dxl_file]:
-            return True
-        else:
-            return False
+        if dxl_file in self.__hash_content_dict:
+            return current_hash == self.__hash_content_dict[dxl_file]
+        return current_hash == self.__hash_store.get("include_hashes",dxl_file)
 
 
     def __includes_dxl2html(self,valid_includes_dict,dxl_file):
         """
-            Generates HTML version of includes
+            Adds the includes whose HTML version must be rendered
         """
 
         def analyse_inc():
             # get include hash content and store it
             self.__hash_file_content(include)
 
-            self.__dxl2html(include,include_content)
-            self.__get_valid_includes(include,include_content,log_error=False)
+            include_summary = self.__summarize(include)
+            self.__add_page(include,include_summary)
             self.__includes_dxl2html(self.__valid_includes_dict,include)
 
         try:
@@ -1173,18 +1253,18 @@ class StartDoors:
                 self.__nb_inc_per_file += 1
 
                 include_basename = self.__get_hash(include)+"_"+os.path.basename(include)
-                include_content = self.__get_dxl_content(include)
+                current_hash = self.__content_hash(include)
 
                 # if HTML version of include already generated, verify if the content has
                 # changed. If content is different or include not generated, analyse it.
-                include_scanned = os.path.exists(self.__output_dir+"\dxl_files"+os.sep+include_basename+".html")
+                # Pages are the ones found before the checks, or generated for this file,
+                # so that the result does not depend on the other files checked
+                include_scanned = include_basename+".html" in self.__scanned_pages or include in self.__hash_content_dict
 
                 if self.__complete:
                     analyse_inc()
                 else:
                     if include_scanned:
-                        current_hash = self.__get_hash(include_content)
-
                         hash_compare = self.__compare_hash_content(include,current_hash)
                         if hash_compare:
                             continue
@@ -1196,7 +1276,37 @@ class StartDoors:
             pass
 
 
-    def __dxl2html(self,dxl_file,dxl_content):
+    def __add_page(self,dxl_file,summary,render=True):
+        """
+            Adds a DXL file to the pages to render, unless render is False,
+            and counts its lines
+        """
+
+        self.__get_valid_includes(dxl_file,summary,log_error=False)
+
+        dxl_file_basename = self.__get_hash(dxl_file)+"_"+os.path.basename(dxl_file)
+        nb_lines = summary.nb_code_lines
+        self.__count_lines += nb_lines
+        self.__loc_dict[dxl_file_basename] = nb_lines
+
+        if render:
+            self.__pages.append((dxl_file,summary.content_hash))
+
+
+    def __page_key(self,dxl_file,summary):
+        """
+            Returns the key of the HTML version of a DXL file, that changes
+            with the content of the file and of its valid includes
+        """
+
+        key = [summary.content_hash]
+        for include in sorted(self.__valid_includes_dict[dxl_file]):
+            key.append(include+" "+self.__content_hash(include))
+
+        return self.__get_hash("\n".join(key))
+
+
+    def __dxl2html(self,dxl_file,analysis):
         """
             Generates HTML version of DXL files
         """
@@ -1216,15 +1326,13 @@ class StartDoors:
         with open(scan_bat,"wb") as f:
             f.write("dxl_scan.py -i start_doors.ini -d FBL-SSDD -s "+dxl_file)
 
-        self.__lexer = Lexer()
-        self.__lexer.build()
-        self.__lexer.init(dxl_content)
+        self.__get_valid_includes(dxl_file,analysis,log_error=False)
 
-        self.__get_valid_includes(dxl_file,dxl_content,log_error=False)
+        # pragmas and function links of the page only depend on the file itself
+        is_error_pragma = self.__is_error_pragma(analysis)
+        func_declarations_dict = self.__get_func_declarations(dxl_file,analysis)
 
-        lines = sorted(self.__lexer.tok_dict.keys())
-        self.__count_lines += len(lines)
-        self.__loc_dict[dxl_file_basename] = len(lines)
+        lines = analysis.tokens.line_numbers()
 
         with open(self.__output_dir+"/dxl_files/"+dxl_file_basename+".html","wb") as f:
             #f.write("<!--%d-->" % lines[-1])
@@ -1233,7 +1341,7 @@ class StartDoors:
             f.write('<meta http-equiv="X-UA-Compatible" content="IE=8"/>')
             f.write("</head><body style='margin:0;'>")
             f.write("<div style=\"border:1.5px solid #4B9FD5; padding-left:20px; font-family:helvetica;\">")
-            f.write("<p>File: %s - Size: %d bytes" % (os.path.basename(dxl_file),os.path.getsize(dxl_file)))
+            f.write("<p>File: %s - Size: %d bytes" % (os.path.basename(dxl_file),analysis.size))
             f.write(" - <a href=%s>Scan this file</a></p>" % os.path.abspath(scan_bat))
 
             f.write("<p>Open original DXL file: <a href=\"file:///%s\">%s</a> - " % (drives.fix_subst_path(dxl_file),dxl_file))
@@ -1242,7 +1350,7 @@ class StartDoors:
 
             # width of line numbers div
             #total_lines = lines[-1]+1
-            total_lines = dxl_content.count("\n")+1
+            total_lines = analysis.nb_lines
 
             if total_lines < 100:
                 width_left = "30"
@@ -1286,10 +1394,10 @@ class StartDoors:
             try:
                 for l in xrange(1,lines[-1]+1):
 
-                    if l in self.__lexer.tok_dict:
-                        line_toks = self.__lexer.tok_dict[l]
+                    line_toks = analysis.tokens.line_tokens(l)
+                    if line_toks:
 
-                        token = self.__lexer.Token()
+                        token = Lexer.Token()
                         current_column = 0
                         for token in line_toks:
                             previous_token_is_sys_call = token.type == "SYS_CALL"
@@ -1392,7 +1500,7 @@ class StartDoors:
 
                             # PRAGMAS
                             elif token.type == "PRAGMA":
-                                if self.__is_error_pragma:
+                                if is_error_pragma:
                                     if "runLim, 0" in token.value or "encoding" in token.value or "stack" in token.value:
                                         v = "<span id=%d><span style='background-color:orange;'>%s</span> <span style='color:#008000; font-family:helvetica'> // DXL Scanner Exception : Pragma is OK</span></span>" % (token.line,token.value)
                                     else:
@@ -1406,10 +1514,10 @@ class StartDoors:
                                 style = self.__syntax_color(token.type,token.value)
                                 func_called = token.value.split("(")[0].rstrip(" ")
 
-                                if self.__func_declarations_dict.has_key(func_called):
+                                if func_declarations_dict.has_key(func_called):
                                     # only a unique declared function => one int in value (type list) of func_declarations_dict
-                                    if len(self.__func_declarations_dict[func_called]) == 1:
-                                        func_def_line = self.__func_declarations_dict[func_called][0] # first item
+                                    if len(func_declarations_dict[func_called]) == 1:
+                                        func_def_line = func_declarations_dict[func_called][0] # first item
                                         v = "<span id=%d><span style=%s><a href=#%d>%s</a></span>(%s</span>" %(token.line,style,func_def_line,token.value.split("(",1)[0],token.value.split("(",1)[-1])
                                     else:
                                         v = "<span id=%d><span style=%s>%s</span></span>" % (token.line,style,token.value)
@@ -1424,8 +1532,10 @@ class StartDoors:
                                     v = "<span id=%d><span style=%s>%s</span>(%s</span>" % (token.line,style,token.value.split("(",1)[0],token.value.split("(",1)[1])
                                     #look for the function declaration in the includes
                                     for include in self.__valid_includes_dict[dxl_file]:
-                                        include_content = self.__get_dxl_content(include)
-                                        func_def_dict = self.__get_func_declarations(include,include_content)
+                                        if not include in self.__include_func_declarations_dict:
+                                            include_summary = self.__summarize(include)
+                                            self.__include_func_declarations_dict[include] = self.__get_func_declarations(include,include_summary)
+                                        func_def_dict = self.__include_func_declarations_dict[include]
 
                                         if func_def_dict.has_key(func_called):
                                             # include where the function is defined
@@ -1502,6 +1612,8 @@ class StartDoors:
                 f.write("</div></body></font></html>")
             except IndexError:
                 pass
+            finally:
+                analysis.tokens.close()
 
 
     def __make_log_file(self,dxl_file):
@@ -1517,13 +1629,15 @@ class StartDoors:
             Init required dictionnaries and variables before __check_files()
         """
 
-        self.__report = dict()
+        self.__report = self.__open_report()
         self.__valid_includes_list = []
         self.__valid_includes_dict = dict()
         self.__hash_content_dict = dict()
+        self.__page_keys = dict()
         self.__defined_functions_dict = dict()
         self.__global_defined_functions = dict()
-        self.__called_functions = []
+        # names of the functions called, without the calls
+        self.__called_functions = set()
         self.__include_dict = dict()
         self.__nb_inc_dict = dict()
         self.__checked_includes = []
@@ -1540,105 +1654,717 @@ class StartDoors:
         self.__loc_dict = dict()
 
 
-    def __check_files(self,txt_filename):
+    def __open_report(self):
+        """
+            Returns a new dictionnary of the errors of each file, kept on
+            disk so that the memory of the scan does not grow with the errors
         """
-            Applies previous function to each DXL file and include
 
-            Gets DXL files from dict_list
-            dxl_files_list contains all DXL files found in {project,addins}_list.txt
-            or a list of files to scan from the command line
+        report_file = self.__output_dir+"/txt/report"
+        if self.__shard:
+            report_file += "_shard_%d_of_%d" % (self.__shard_number,self.__shard_count)
+
+        return shelve.open(report_file,"n",pickle.HIGHEST_PROTOCOL)
+
+
+    def __new_file_vars(self):
+        """
+            Init the dictionnaries and variables of FileResult before _check_file()
+        """
+
+        self.__report = dict()
+        self.__valid_includes_dict = dict()
+        self.__hash_content_dict = dict()
+        self.__defined_functions_dict = dict()
+        self.__called_functions = []
+        self.__include_dict = dict()
+        self.__nb_inc_dict = dict()
+        self.__loc_dict = dict()
+        self.__rule_stats = dict()
+        self.__pages = []
+
+        self.__count_lines = 0
+        self.__count_functions = 0
+        self.__count_includes = 0
+        self.__nb_inc_per_file = 0
+
+
+    def __read_previous_scan(self):
+        """
+            Lists the HTML versions of the previous scans and opens the
+            store of their hashes, the same for every menu until the end of
+            the scan so that the result does not depend on the order in
+            which the menus are checked
+        """
+
+        self.__scanned_pages = set(os.listdir(self.__output_dir+os.sep+"dxl_files"))
+        self.__hash_store = self.__open_hash_store()
+
+
+    def __open_hash_store(self):
+        """
+            Returns the store of the hashes of the includes and the keys of
+            the HTML versions of the previous scans
+        """
+
+        return hash_store.HashStore(self.__output_dir+"/txt/hashes.db")
+
+
+    def __worker_settings(self,dxl_basenames):
+        """
+            Returns the attributes _init_worker() sets for _check_file()
+        """
+
+        return {
+            "output_dir": self.__output_dir,
+            "addin_dirs": self.__addin_dirs,
+            "project_dirs": self.__project_dirs,
+            "complete": self.__complete,
+            "lextab": self.__lextab,
+            "linear_lexing": self.__linear_lexing,
+            "scanner": self.__scanner,
+            "profile_lexer": self.__profile_lexer,
+            "minimum_tokens": self.__minimum_tokens,
+            "force_hash": self.__force_hash,
+            "dxl_basenames": dxl_basenames,
+            "scanned_pages": self.__scanned_pages,
+        }
+
+
+    def _init_worker(self,settings):
+        """
+            Prepares this instance to check files with _check_file(),
+            in a --jobs worker process or in the main one
         """
 
+        for key, value in settings.items():
+            setattr(self, "_%s__%s" % (self.__class__.__name__, key), value)
+
+        with open("builtin_functions.txt","rb") as f:
+            self.__builtin_fcts_dict = pickle.load(f)
+
+        # lexer built once and reused for every file and include
+        self.__lexer = self.__get_lexer()
+        self.__analysis_cache = self.__open_analysis_cache()
+        self.__content_hashes = dict()
+        self.__file_hashes = dict()
+        self.__hash_store = self.__open_hash_store()
+
+        # analyses of includes shared by the files checked by this instance
+        self.__include_func_declarations_dict = dict()
+        self.__path_probe = path_probe.PathProbe()
+        self.__include_errors_dict = dict()
+
+        self.__new_file_vars()
+
+
+    def _check_file(self,dxl_file,data=None):
+        """
+            Checks a DXL file and its includes, generates their HTML
+            versions and returns a FileResult
+            data is the content of the file when read ahead
+
+            Only depends on the file and on the settings of _init_worker(),
+            so that files can be checked by several processes
+        """
+
+        start_time = time.time()
+        self.__new_file_vars()
+
+        # Single lexing pass over the memory-mapped file (or the content
+        # read ahead) shared by every check, none if the content was
+        # analysed by a previous scan
+        analysis = self.__summarize(dxl_file,data)
+
+        #------------------------------------------------------------------
+        # CHECKS for DXL files
+
+        # Get includes from dxl file and test if valid
+        self.__get_valid_includes(dxl_file,analysis,log_error=True)
+
+        # String initializations
+        self.__check_string_init(dxl_file,analysis)
+
+        # System calls
+        self.__check_sys_calls(dxl_file,analysis)
+
+        # Pragmas
+        self.__check_pragmas(dxl_file,analysis)
+
+        # Duplicate files
+        self.__check_duplicates(dxl_file)
+
+        # Comment for DXL to be executed by DOORS
+        #self.__is_exec_by_doors = self.__file_exec_by_doors(dxl_file,analysis)
+
+        # Functions with the same name in different files
+        self.__func_declarations_dict = self.__get_func_declarations(dxl_file,analysis)
+        #self.__get_functions_duplications(dxl_file,dxl_content)
+        self.__get_defined_functions(dxl_file)
+        self.__get_called_functions(dxl_file,analysis)
+
+        result = FileResult(dxl_file)
+        result.errors = list(self.__report.get(dxl_file,[]))
+
+        # Code duplications, found by the parent from the fingerprints
+        result.fingerprints.append((dxl_file,analysis.fingerprints))
+
+        #------------------------------------------------------------------
+        # CHECKS for includes, reported by the parent for the first file
+        # including them
+        for include in self.__valid_includes_dict[dxl_file]:
+            if include not in self.__include_errors_dict:
+                nb_errors = len(self.__report.get(include,[]))
+                include_analysis = self.__summarize(include)
+
+                self.__check_string_init(include,include_analysis)
+                self.__check_sys_calls(include,include_analysis)
+                self.__check_pragmas(include,include_analysis)
+                #self.__func_declarations_dict = self.__get_func_declarations(include,include_analysis)
+                #self.__get_defined_functions(include)
+                #self.__get_called_functions(include,include_analysis)
+                self.__include_errors_dict[include] = self.__report.get(include,[])[nb_errors:]
+                result.fingerprints.append((include,include_analysis.fingerprints))
+            result.include_errors.append((include,self.__include_errors_dict[include]))
+
+        #------------------------------------------------------------------
+        # HTML version of each DXL file, rendered by _render_page() unless
+        # the one of the previous scans is up to date
+        page_key = self.__page_key(dxl_file,analysis)
+        dxl_file_basename = self.__get_hash(dxl_file)+"_"+os.path.basename(dxl_file)
+        page_scanned = dxl_file_basename+".html" in self.__scanned_pages
+        render = self.__complete or not page_scanned or page_key != self.__hash_store.get("page_keys",dxl_file)
+        self.__add_page(dxl_file,analysis,render)
+        result.page_keys[dxl_file] = page_key
+
+        # get includes recursively for dxl file
+        self.__includes_dxl2html(self.__valid_includes_dict,dxl_file)
+
+        # Get number of includes for each main file
+        dxl_hash = self.__get_hash(dxl_file)+"_"+os.path.basename(dxl_file)
+        self.__nb_inc_dict[dxl_hash] = self.__nb_inc_per_file
+
+        result.valid_includes_dict = self.__valid_includes_dict
+        result.defined_functions_dict = self.__defined_functions_dict
+        result.called_functions = self.__called_functions
+        result.include_dict = self.__include_dict
+        result.nb_inc_dict = self.__nb_inc_dict
+        result.loc_dict = self.__loc_dict
+        result.hash_content_dict = self.__hash_content_dict
+        result.count_lines = self.__count_lines
+        result.count_functions = self.__count_functions
+        result.count_includes = self.__count_includes
+        result.rule_stats = self.__rule_stats
+        result.pages = self.__pages
+        result.file_hashes = self.__file_hashes
+        self.__file_hashes = dict()
+        result.seconds = time.time()-start_time
+
+        return result
+
+
+    def _render_page(self,page):
+        """
+            Generates the HTML version of a DXL file checked by _check_file(),
+            page being the file and its content hash
+            Returns the lexer rules profile of the rendering
+        """
+
+        dxl_file, content_hash = page
+        self.__valid_includes_dict = dict()
+        self.__rule_stats = dict()
+
+        # rendered from the summary the check added to the cache, the file
+        # only lexed again if the summary could not be read back
+        summary = self.__analysis_cache.get(content_hash)
+        if summary is None:
+            analysis = self.__analyse(dxl_file)
+        else:
+            analysis = summary.analysis(dxl_file)
+        self.__dxl2html(dxl_file,analysis)
+        analysis.tokens.close()
+
+        return self.__rule_stats
+
+
+    def __merge_file_result(self,result):
+        """
+            Merges the FileResult of a DXL file into the scan state
+            Results must be merged in file list order
+        """
+
+        dxl_file = result.dxl_file
+
+        self.__report[dxl_file] = result.errors
+        self.__count_issues += len(result.errors)
+
+        for include, errors in result.include_errors:
+            if include not in self.__checked_includes:
+                self.__checked_includes.append(include)
+                for e in errors:
+                    self.__add_error(include,e)
+
+        self.__valid_includes_dict.update(result.valid_includes_dict)
+        self.__valid_includes_list.append(self.__valid_includes_dict)
+
+        for function_def, dxl_files in result.defined_functions_dict.items():
+            if not function_def in self.__defined_functions_dict:
+                self.__defined_functions_dict[function_def] = []
+            self.__defined_functions_dict[function_def].extend(dxl_files)
+        self.__called_functions.update(result.called_functions)
+
+        for include, dxl_files in result.include_dict.items():
+            if not include in self.__include_dict:
+                self.__include_dict[include] = []
+            self.__include_dict[include].extend(dxl_files)
+
+        self.__nb_inc_dict.update(result.nb_inc_dict)
+        self.__loc_dict.update(result.loc_dict)
+        self.__hash_content_dict.update(result.hash_content_dict)
+        self.__page_keys.update(result.page_keys)
+        self.__file_hashes.update(result.file_hashes)
+
+        self.__count_lines += result.count_lines
+        self.__count_functions += result.count_functions
+        self.__count_includes += result.count_includes
+
+        if self.__duplicate_finder is not None:
+            for path, fingerprints in result.fingerprints:
+                self.__duplicate_finder.add(path,fingerprints)
+
+        if self.__profile_lexer:
+            merge_rule_stats(self.__scan_rule_stats,result.rule_stats)
+            self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Lexer rules profile of "+dxl_file+"\n"+rule_stats_table(result.rule_stats))
+
+
+    def __file_size(self,dxl_file):
+        """
+            Returns the size of dxl_file from the directory listings of the
+            trees, or from the file system once if not listed
+        """
+
+        size = self.__file_stats.get(dxl_file,(None,None))[0]
+        if size is None:
+            st = os.stat(dxl_file)
+            self.__file_stats[dxl_file] = (st.st_size,st.st_mtime)
+            size = st.st_size
+
+        return size
+
+
+    def __schedule(self,dxl_files_list,timings,chunk):
+        """
+            Returns the indexes of dxl_files_list by decreasing predicted
+            check time: the time of the previous scan, or for new files
+            their size at the mean speed of the files timed before
+
+            Files are only reordered inside consecutive chunks of files,
+            so that a result waits at most for the other files of its chunk
+            before being merged
+        """
+
+        sizes = []
+        for dxl_file in dxl_files_list:
+            try:
+                sizes.append(self.__file_size(dxl_file))
+            except OSError:
+                sizes.append(0)
+
+        timed_seconds = 0
+        timed_bytes = 0
+        for dxl_file, size in zip(dxl_files_list,sizes):
+            if dxl_file in timings:
+                timed_seconds += timings[dxl_file]
+                timed_bytes += size
+        seconds_per_byte = timed_seconds/max(timed_bytes,1)
+        if timed_seconds == 0:
+            seconds_per_byte = 1.0
+
+        costs = []
+        for dxl_file, size in zip(dxl_files_list,sizes):
+            costs.append(timings.get(dxl_file,size*seconds_per_byte))
+
+        schedule = []
+        for start in xrange(0,len(dxl_files_list),chunk):
+            schedule.extend(sorted(xrange(start,min(start+chunk,len(dxl_files_list))),key=lambda i: costs[i],reverse=True))
+
+        return schedule
+
+
+    def __parse_shard(self):
+        """
+            Sets the shard number and the number of shards of --shard i/N
+            or --merge N
+        """
+
+        self.__shard_number = None
+        self.__shard_count = None
+
+        if self.__shard and self.__merge:
+            self.__error("--shard and --merge can not be used together")
+
+        if self.__shard:
+            try:
+                shard_number, shard_count = [int(n) for n in self.__shard.split("/")]
+            except ValueError:
+                self.__error("--shard must be i/N, e.g. 1/4: "+self.__shard)
+            if not 1 <= shard_number <= shard_count:
+                self.__error("--shard i/N must verify 1 <= i <= N: "+self.__shard)
+            self.__shard_number = shard_number
+            self.__shard_count = shard_count
+
+        elif self.__merge:
+            try:
+                self.__shard_count = int(self.__merge)
+            except ValueError:
+                self.__error("--merge must be a number of shards: "+self.__merge)
+            if self.__shard_count < 1:
+                self.__error("--merge must be a number of shards: "+self.__merge)
+
+
+    def __parse_window(self):
+        """
+            Checks the number of files of --window, at least 1 file must be
+            checked ahead of the merge for the scan to go on
+        """
+
+        try:
+            window = int(self.__window)
+        except ValueError:
+            self.__error("--window must be a number of files: "+self.__window)
+        if window < 1:
+            self.__error("--window must be at least 1: "+self.__window)
+
+
+    def __shard_indexes(self,dxl_files_list):
+        """
+            Returns the indexes of the files of dxl_files_list checked by
+            this shard, all of them without --shard
+
+            A file belongs to the shard of the hash of its path, so that
+            every shard computes the same partition and a file stays in
+            the same shard when files are added or removed
+        """
+
+        if self.__shard_count is None:
+            return range(len(dxl_files_list))
+
+        return [i for i, dxl_file in enumerate(dxl_files_list) if int(self.__get_hash(dxl_file),16) % self.__shard_count == self.__shard_number-1]
+
+
+    def __shard_file(self,txt_filename,shard_number):
+        """
+            Returns the path of the results of a shard for a files list
+        """
+
+        if self.__scan_file:
+            name = "scan_file"
+        else:
+            name = os.path.splitext(os.path.basename(txt_filename))[0]
+
+        return self.__output_dir+"/txt/%s_shard_%d_of_%d.txt" % (name,shard_number,self.__shard_count)
+
+
+    def __read_shard(self,shard_file,dxl_files_list):
+        """
+            Generator of the (index, FileResult) saved by a shard,
+            in file list order
+        """
+
+        if not os.path.exists(shard_file):
+            self.__error("Missing shard results "+shard_file+", run the shard before --merge")
+
+        with open(shard_file,"rb") as f:
+            if pickle.load(f) != dxl_files_list:
+                self.__error("Shard results "+shard_file+" were saved for another list of files")
+            while True:
+                try:
+                    item = pickle.load(f)
+                except (EOFError,pickle.UnpicklingError):
+                    self.__error("Incomplete shard results "+shard_file)
+                if item is None:
+                    return
+                yield item
+
+
+    def __checks(self,txt_filename,dxl_menu=None):
+        """
+            Generator checking the files of __check_files(), after saving
+            the tree of dxl_menu in txt_filename if given
+
+            Yields (dxl_files_list, indexes, pending) of the files to check,
+            then (index, FileResult) of each file as soon as it is checked,
+            and (None, lexer rules profile of the rendering) at the end
+
+            At most --window files are checked before the merge of their
+            results: the consumer releases pending for each result merged.
+
+            HTML versions of the files and includes are rendered once each,
+            by the pool as soon as a file is checked or after the checks,
+            not at all with --no-render
+        """
+
+        if dxl_menu is not None:
+            self.__save_tree(txt_filename,dxl_menu)
+
         if self.__scan_file:
             dxl_files_list = self.__scan_file
         else:
             dxl_files_list = self.__get_dxl_files(txt_filename)
 
-        tpb = text_progress_bar.TextProgressBar(len(dxl_files_list))
+        if self.__merge:
+            indexes = range(len(dxl_files_list))
+            pending = None
+        else:
+            indexes = self.__shard_indexes(dxl_files_list)
+            pending = threading.Semaphore(int(self.__window))
 
-        with open("builtin_functions.txt","rb") as f:
-            self.__builtin_fcts_dict = pickle.load(f)
+        yield dxl_files_list, indexes, pending
 
+        # files by basename for duplicate files check
+        dxl_basenames = dict()
         for dxl_file in dxl_files_list:
+            dxl_basename = os.path.basename(dxl_file)
+            if not dxl_basename in dxl_basenames:
+                dxl_basenames[dxl_basename] = []
+            dxl_basenames[dxl_basename].append(dxl_file)
+
+        # check time of each file in the previous scans
+        timings = self.__load_timings()
+
+        jobs = int(self.__jobs)
+        pool = None
+        if self.__merge:
+            # files checked and pages rendered by the shards, results
+            # read one at a time from each shard
+            shard_files = [self.__shard_file(txt_filename,n) for n in xrange(1,self.__shard_count+1)]
+            results = heapq.merge(*[self.__read_shard(shard_file,dxl_files_list) for shard_file in shard_files])
+        else:
+            settings = self.__worker_settings(dxl_basenames)
+            if jobs > 1 or self.__concurrent_menus:
+                # workers take the next file from the queue of the pool when
+                # idle, so scheduling expensive files first keeps a long file
+                # from being checked alone at the end of the scan. Half a
+                # window keeps the files of the next chunk checked while
+                # the last ones of a chunk are.
+                chunk = max(int(self.__window)/2,1)
+                schedule = [indexes[k] for k in self.__schedule([dxl_files_list[i] for i in indexes],timings,chunk)]
+                pool = multiprocessing.Pool(jobs,_init_worker,(settings,))
+            else:
+                schedule = indexes
+                _init_worker(settings)
 
-            self.__count_files += 1
-            self.__nb_inc_per_file = 0
+            # (file, content read ahead or None)
+            scheduled_files = [dxl_files_list[i] for i in schedule]
+            if int(self.__read_ahead) > 0:
+                contents = read_ahead.ReadAhead(scheduled_files,int(self.__read_ahead),int(self.__read_ahead_bytes))
+            else:
+                contents = itertools.izip(scheduled_files,itertools.repeat(None))
+            tasks = self.__pending_tasks(itertools.izip(schedule,contents),pending)
 
-            fs = os.path.getsize(dxl_file)
-            if fs>500*1000:
-                self.__add_error(dxl_file,OversizeFileError("File (%d bytes) too big" % fs))
+            if pool is not None:
+                # tasks are sent through a pipe, that blocks the read-ahead
+                # when workers are busy
+                results = pool.imap_unordered(_check_file,tasks)
             else:
-                # output log file
-                self.__make_log_file(dxl_file)
+                results = itertools.imap(_check_file,tasks)
+
+        # pages rendered in the pool as soon as requested, or in this
+        # process after the checks
+        rendered_pages = set()
+        pages = []
+        renderings = []
+        render_rule_stats = dict()
+
+        try:
+            for i, result in results:
+                if not self.__no_render and not self.__merge:
+                    for page in result.pages:
+                        if page not in rendered_pages:
+                            rendered_pages.add(page)
+                            if pool is not None:
+                                renderings.append(pool.apply_async(_render_page,(page,)))
+                            else:
+                                pages.append(page)
+
+                yield i, result
+
+            if rendered_pages:
+                self.__message("Rendering %d HTML files..." % len(rendered_pages))
+            for page in pages:
+                renderings.append(_render_page(page))
+            for rendering in renderings:
+                if pool is not None:
+                    rendering = rendering.get()
+                merge_rule_stats(render_rule_stats,rendering)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        yield None, render_rule_stats
+
+
+    def __pending_tasks(self,scheduled_contents,pending):
+        """
+            Generator of the (index, file, content) tasks of _check_file(),
+            waiting for pending before each task so that at most --window
+            results are not merged yet. In the pool, waiting blocks the
+            thread feeding the workers, and so the read-ahead.
+        """
+
+        for i, (dxl_file, data) in scheduled_contents:
+            pending.acquire()
+            yield i, dxl_file, data
+
+
+    def __in_background(self,items):
+        """
+            Iterates over items in a thread, ahead of the consumer of the
+            returned generator, that gets the exceptions of the thread
+        """
+
+        # the items of the checks are bounded by --window
+        queue = Queue.Queue(int(self.__window))
+        end = object()
+
+        def produce():
+            try:
+                for item in items:
+                    queue.put((item,None))
+                queue.put((end,None))
+            except:
+                queue.put((None,sys.exc_info()))
+
+        thread = threading.Thread(target=produce)
+        thread.daemon = True
+        thread.start()
+
+        while True:
+            item, exc_info = queue.get()
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            if item is end:
+                return
+            yield item
+
+
+    def __load_timings(self):
+        """
+            Returns the check time of each file in the previous scans
+        """
+
+        timings_file = self.__output_dir+"/txt/timings.txt"
+        timings = dict()
+        if os.path.exists(timings_file):
+            with open(timings_file,"rb") as f:
+                timings = pickle.load(f)
+
+        return timings
+
+
+    def __check_files(self,txt_filename,checks=None):
+        """
+            Applies previous function to each DXL file and include
+
+            Gets DXL files from dict_list
+            dxl_files_list contains all DXL files found in {project,addins}_list.txt
+            or a list of files to scan from the command line
 
-                tpb.progress(current_object=os.path.basename(dxl_file)+" (%d bytes)" % os.path.getsize(dxl_file))
+            The files are checked by __checks(), or by checks started
+            before with --concurrent-menus
+
+            With --jobs N the files are checked by N processes, most
+            expensive first according to the timings of the previous scans,
+            and their results merged in file list order, as when checked
+            one by one
+
+            With --shard i/N only the files of the shard are checked, and
+            their results saved for --merge N instead of the global checks.
+            --merge N reads the results of the N shards in file list order,
+            as if they were checked by this process, then runs the global
+            checks.
+        """
 
-                self.__report[dxl_file] = []
+        if checks is None:
+            checks = self.__checks(txt_filename)
 
-                # Get content of each dxl file
-                dxl_content = self.__get_dxl_content(dxl_file)
+        dxl_files_list, indexes, pending = next(checks)
 
-                self.__lexer = Lexer()
-                self.__lexer.build()
-                self.__lexer.init(dxl_content)
+        tpb = text_progress_bar.TextProgressBar(len(indexes))
 
-                #------------------------------------------------------------------
-                # CHECKS for DXL files
+        # check time of each file checked
+        timings = dict()
 
-                # Get includes from dxl file and test if valid
-                self.__get_valid_includes(dxl_file,dxl_content,log_error=True)
-                self.__valid_includes_list.append(self.__valid_includes_dict)
+        # results of the shard saved as they are merged, in file list order
+        if self.__shard:
+            shard_file = open(self.__shard_file(txt_filename,self.__shard_number),"wb")
 
-                # String initializations
-                self.__check_string_init(dxl_file,dxl_content)
+        # results waiting for the ones before them in dxl_files_list
+        checked = dict()
+        next_merged = 0
 
-                # System calls
-                self.__check_sys_calls(dxl_file,dxl_content)
+        try:
+            if self.__shard:
+                pickle.dump(dxl_files_list,shard_file,pickle.HIGHEST_PROTOCOL)
 
-                # Pragmas
-                self.__check_pragmas(dxl_file,dxl_content)
+            for i, result in checks:
+                if i is None:
+                    # end of the checks
+                    if self.__profile_lexer:
+                        merge_rule_stats(self.__scan_rule_stats,result)
+                    continue
 
-                # Duplicate files
-                self.__check_duplicates(dxl_file,dxl_files_list)
+                dxl_file = result.dxl_file
+                timings[dxl_file] = result.seconds
 
-                # Comment for DXL to be executed by DOORS
-                #self.__is_exec_by_doors = self.__file_exec_by_doors(dxl_file,dxl_content)
+                tpb.progress(current_object=os.path.basename(dxl_file)+" (%d bytes)" % self.__file_size(dxl_file))
 
-                # Functions with the same name in different files
-                self.__func_declarations_dict = self.__get_func_declarations(dxl_file,dxl_content)
-                #self.__get_functions_duplications(dxl_file,dxl_content)
-                self.__get_defined_functions(dxl_file,dxl_content)
-                self.__get_called_functions(dxl_file,dxl_content)
+                checked[i] = result
+                while next_merged < len(indexes) and indexes[next_merged] in checked:
+                    result = checked.pop(indexes[next_merged])
+                    if self.__shard:
+                        pickle.dump((indexes[next_merged],result),shard_file,pickle.HIGHEST_PROTOCOL)
+                    next_merged += 1
 
-                self.__count_issues += len(self.__report[dxl_file])
+                    self.__count_files += 1
 
-                #------------------------------------------------------------------
-                # CHECKS for includes
-                for include in self.__valid_includes_dict[dxl_file]:
-                    if include not in self.__checked_includes:
-                        self.__checked_includes.append(include)
-                        include_content = self.__get_dxl_content(include)
-                        self.__lexer.get_tokens(include_content)
+                    # output log file
+                    self.__make_log_file(result.dxl_file)
 
-                        self.__check_string_init(include,include_content)
-                        self.__check_sys_calls(include,include_content)
-                        self.__check_pragmas(include,include_content)
-                        #self.__func_declarations_dict = self.__get_func_declarations(include,include_content)
-                        #self.__get_defined_functions(include,include_content)
-                        #self.__get_called_functions(include,include_content)
+                    self.__merge_file_result(result)
 
-                #------------------------------------------------------------------
-                # Generate HTML version of each DXL file
-                self.__dxl2html(dxl_file,dxl_content)
+                    if pending is not None:
+                        pending.release()
 
-                # get includes recursively for dxl file
-                self.__includes_dxl2html(self.__valid_includes_dict,dxl_file)
+            tpb.end()
 
-                # Get number of includes for each main file
-                dxl_hash = self.__get_hash(dxl_file)+"_"+os.path.basename(dxl_file)
-                self.__nb_inc_dict[dxl_hash] = self.__nb_inc_per_file
+            if next_merged < len(indexes):
+                self.__error("No results for %d files of the shards" % (len(indexes)-next_merged))
 
-        tpb.end()
+            # end of complete shard results
+            if self.__shard:
+                pickle.dump(None,shard_file,pickle.HIGHEST_PROTOCOL)
+        finally:
+            if self.__shard:
+                shard_file.close()
+
+        # timings, hashes and global checks are written by --merge
+        if self.__shard:
+            return
+
+        # timings of the previous scans read again, as other checks may
+        # have written them since with --concurrent-menus
+        all_timings = self.__load_timings()
+        all_timings.update(timings)
+        with open(self.__output_dir+"/txt/timings.txt","wb") as f:
+            pickle.dump(all_timings,f)
+
+        # hashes of the includes and keys of the files whose HTML versions
+        # are up to date, written in the store at the end of the scan
+        if not self.__no_render:
+            self.__hash_store.set("include_hashes",self.__hash_content_dict)
+            self.__hash_store.set("page_keys",self.__page_keys)
 
         # Global Checks
         #------------------------------------------------------------------
@@ -1648,7 +2374,7 @@ class StartDoors:
         # Generate report for function duplications in files
         self.__report_redefined_functions()
 
-        # Identify from hash_content.txt includes with same content
+        # Identify from the hashes of the includes the ones with same content
         self.__check_same_include_content()
 
         # Make a list of all defined functions
@@ -1764,69 +2490,37 @@ class StartDoors:
             f.write("</body></font></html>")
 
 
-    def __gen_cpd_bat(self):
-        """
-            Generates batch file for code duplication checks
-        """
-
-        with open("dxl_cpd_runner.bat","wb") as f:
-            f.write("@echo off\n\n")
-            f.write("CD /D %~dp0\n\n")
-
-            path_dir_list = []
-            for d in [self.__projects_list,self.__addins_list,self.__extra_list]:
-                if os.path.exists(d):
-                    if d == self.__projects_list:
-                        path_dir_list.append(self.__project_dirs)
-                    elif d == self.__addins_list:
-                        path_dir_list.append(self.__addin_dirs)
-                    elif d == self.__extra_list:
-                        path_dir_list.append(self.__extra_dirs)
-            for path_dir in path_dir_list:
-                    for path in path_dir:
-                        # avoid this particular path as it crashes (too many files)
-                        if not path == r"K:\CODE\DOORS_TOOLS\PROD":
-                            path_mod = path.replace(":","").replace("\\","_")
-                            f.write("java -Xmx1024m -classpath cpd/bin net.sourceforge.pmd.cpd.CPD --minimum-tokens 20")
-                            f.write(" --files "+path)
-                            f.write(" --language dxl --skip-lexical-errors --skip-duplicate-files --format xml --encoding utf-8 > cpd/cpd_"+path_mod+".xml\n\n")
-
-
     def __gen_cpd_report(self):
         """
-            Generates reports for code duplication
+            Generates report for code duplications found in the files of
+            every menu and in their includes
         """
 
+        duplications = self.__duplicate_finder.duplications()
+
         with open(self.__output_dir+"/report_cpd.html","wb") as f:
-            f.write("<html><font face=\"helvetica\" size=\"2\"><head><title>CPD reports</title>")
+            f.write("<html><font face=\"helvetica\" size=\"2\"><head><title>Code duplications</title>")
             f.write("<meta http-equiv='X-UA-Compatible' content='IE=8' />")
             f.write(self.__template.get_css())
             f.write("</head><body>")
             f.write(self.__template.get_header())
-            f.write("<h1 style='padding-left:30px;'>CPD reports for each directory</h1>")
-            f.write("<ul style='line-height:1.5 !important; font-size:15px;'>Code duplications in :<br><br>")
-            path_dir_list = []
-            for d in [self.__projects_list, self.__addins_list, self.__extra_list]:
-                if os.path.exists(d):
-                    if d == self.__projects_list:
-                        path_dir_list.append(self.__project_dirs)
-                    elif d == self.__addins_list:
-                        path_dir_list.append(self.__addin_dirs)
-                    elif d == self.__extra_list:
-                        path_dir_list.append(self.__extra_dirs)
-            for path_dir in path_dir_list:
-                for path in path_dir:
-                    # this path is not entirely analyzed so don't show it and only show
-                    # reports that contains duplications (< 1KB => 0 duplications)
-                    if not path == "K:\CODE\DOORS_TOOLS\PROD":
-                        report_path = "cpd/"+"cpd_"+path.replace(":","").replace("\\","_")+".xml"
-                        report_size = os.path.getsize(report_path)
-                        if report_size > 1024:
-                            path_link = "../"+report_path
-                            f.write("<li style='margin-left:20px;'><a href="+path_link+">"+path+"</a></li>")
+            f.write("<h1 style='padding-left:30px;'>Code duplications (at least %d tokens)</h1>" % self.__duplicate_finder.min_tokens)
+            f.write("<ul>")
+
+            for duplication in duplications:
+                f.write("<br><li><b>%d</b> tokens duplicated in :</li>\n" % duplication.tokens)
+                f.write("<ul>")
+                for dxl_file, first_line, last_line in duplication.occurrences:
+                    html_file_path = "dxl_files/"+self.__get_hash(dxl_file)+"_"+os.path.basename(dxl_file)+".html"
+                    f.write("<li><a href='"+html_file_path.replace(" ","%20")+"#"+str(first_line)+"'>"+os.path.normpath(dxl_file)+"</a>")
+                    f.write(" at lines %d to %d</li>\n" % (first_line,last_line))
+                f.write("</ul>")
+
             f.write("</ul>")
             f.write("</body></font></html>")
 
+        self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - %d code duplications\n" % len(duplications))
+
 
     def __doit(self):
         port_number = "" #Port number of database
@@ -1863,6 +2557,15 @@ class StartDoors:
             except:
                 pass
 
+        self.__scan_rule_stats = dict()
+        self.__parse_shard()
+        self.__parse_window()
+
+        # file -> (size, mtime) from the directory listings of the trees
+        self.__file_stats = dict()
+        # txt file -> pickled trees saved by __save_tree()
+        self.__trees = dict()
+
         uinfo = network_specifics.get_user_infos()
         self.__user_tgi = uinfo.id+" ("+uinfo.get_fullname()+")"
         self.__template = Template()
@@ -1882,11 +2585,23 @@ class StartDoors:
             os.rename(self.__output_dir,self.__output_dir+complete_date)"""
 
         #create script dirs
-        if not os.path.exists(self.__output_dir):
-            os.mkdir(self.__output_dir)
-            dirs = ["logs","txt","edit_bat","dxl_files","scan_bat"]
-            for d in dirs:
-                os.mkdir(self.__output_dir+os.sep+d)
+        dirs = ["logs","txt","edit_bat","dxl_files","scan_bat","cache"]
+        for d in [""]+dirs:
+            self.__make_dir(self.__output_dir+os.sep+d)
+
+        # lexer of the files analysed by this process for the trees,
+        # profiled with the whole scan
+        self.__lexer = self.__get_lexer()
+        self.__rule_stats = self.__scan_rule_stats
+
+        # summaries of the files analysed for the trees
+        self.__analysis_cache = self.__open_analysis_cache()
+        self.__content_hashes = dict()
+        # stamps of the files read by the scan, kept by --merge for the
+        # shards
+        self.__file_hashes = dict()
+        # directory -> names of the DXL files listed in its .idx files
+        self.__idx_names_dict = dict()
 
         #-----------------------------------------------------------------------------------------------------
         #Get dxl menus
@@ -1912,14 +2627,24 @@ class StartDoors:
         # log file initialization
 
         log_dir = "logs/"+today_date
-        if not os.path.exists(self.__output_dir+os.sep+log_dir):
-            os.mkdir(self.__output_dir+os.sep+log_dir)
+        self.__make_dir(self.__output_dir+os.sep+log_dir)
+        if self.__shard:
+            # shards started at the same time in the same output directory
+            complete_date += "_shard_%d_of_%d" % (self.__shard_number,self.__shard_count)
         self.__log_file_name = os.path.join(log_dir,"log"+complete_date+".txt")
         self.__log_file = open(self.__output_dir+os.sep+self.__log_file_name,"wb")
         self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S - %d/%m/%y")+" - DXL Scanner : scan launched by "+ self.__user_tgi +"\n")
 
         self.__report = dict()
 
+        self.__read_previous_scan()
+
+        # code duplications in and between the files of every menu, found
+        # by --merge for the shards
+        self.__duplicate_finder = None
+        if not self.__shard:
+            self.__duplicate_finder = dup_finder.DuplicateFinder(int(self.__minimum_tokens),tokens_file=self.__output_dir+"/txt/tokens")
+
         if self.__scan_file:
             self.__message("Checking file(s)...")
             self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Checking file(s)\n")
@@ -1940,20 +2665,36 @@ class StartDoors:
             with open(self.__extra_includes_list,"wb") as f:
                 pickle.dump(extra_files_includes_list,f)
 
+            if self.__shard:
+                # the tree is generated by --merge
+                self.__close_log_file()
+                return
+
             self.__txt2html(self.__extra_list,self.__extra_includes_list,self.__extra_tree,self.__extra_dirs)
 
         else:
             #-----------------------------------------------------------------------------------------------------
             #Write tree directory of .dxl files folders
-            self.__message("Building projects tree directory...")
-            self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Building projects tree directory from "+str(self.__project_dirs)+"\n")
-            self.__save_tree(self.__projects_list,self.__project_dirs)
-            self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Done building projects tree directory\n")
+            if self.__concurrent_menus:
+                # trees built and files checked in the background for both
+                # menus, results merged below in the same order as one by one
+                self.__message("Building trees directory and checking files for projects and addins...")
+                self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Building trees directory and checking files concurrently from "+str(self.__project_dirs)+" and "+str(self.__addin_dirs)+"\n")
+                projects_checks = self.__in_background(self.__checks(self.__projects_list,self.__project_dirs))
+                addins_checks = self.__in_background(self.__checks(self.__addins_list,self.__addin_dirs))
+            else:
+                self.__message("Building projects tree directory...")
+                self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Building projects tree directory from "+str(self.__project_dirs)+"\n")
+                self.__save_tree(self.__projects_list,self.__project_dirs)
+                self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Done building projects tree directory\n")
+
+                self.__message("Building addins tree directory...")
+                self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Building addins tree directory from "+str(self.__addin_dirs)+"\n")
+                self.__save_tree(self.__addins_list,self.__addin_dirs)
+                self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Done building addins tree directory\n")
 
-            self.__message("Building addins tree directory...")
-            self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Building addins tree directory from "+str(self.__addin_dirs)+"\n")
-            self.__save_tree(self.__addins_list,self.__addin_dirs)
-            self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Done building addins tree directory\n")
+                projects_checks = None
+                addins_checks = None
 
             #-----------------------------------------------------------------------------------------------------
             #Check rules in projects and addins files
@@ -1961,7 +2702,7 @@ class StartDoors:
 
             self.__message("Checking files for projects...")
             self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Checking files for projects\n")
-            self.__check_files(self.__projects_list)
+            self.__check_files(self.__projects_list,projects_checks)
             projects_files_includes_list = self.__valid_includes_list
             self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Done checking files for projects\n")
 
@@ -1970,24 +2711,29 @@ class StartDoors:
 
             self.__message("Checking files for addins...")
             self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Checking files for addins\n")
-            self.__check_files(self.__addins_list)
+            self.__check_files(self.__addins_list,addins_checks)
             addins_files_includes_list = self.__valid_includes_list
             self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Done checking files for addins\n")
 
             with open(self.__addins_includes_list,"wb") as f:
                 pickle.dump(addins_files_includes_list,f)
 
+            if self.__shard:
+                # trees, code duplications and reports are generated by --merge
+                self.__close_log_file()
+                return
+
             #-----------------------------------------------------------------------------------------------------
             #Get tree directory and generate HTML template
             self.__txt2html(self.__projects_list,self.__projects_includes_list,self.__projects_tree,self.__project_dirs)
             self.__txt2html(self.__addins_list,self.__addins_includes_list,self.__addins_tree,self.__addin_dirs)
 
             #-----------------------------------------------------------------------------------------------------
-            # CPD check
-            self.__gen_cpd_bat()
-            self.__message("Starting CPD for code duplication check...")
-            os.system("dxl_cpd_runner.bat")
+            # Code duplications
+            self.__message("Finding code duplications...")
+            self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Finding code duplications\n")
             self.__gen_cpd_report()
+            self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Done finding code duplications\n")
 
             # check which directories have been scanned
             dirs = [self.__projects_list,self.__addins_list,self.__extra_list]
@@ -2027,8 +2773,56 @@ class StartDoors:
             self.__message("Generating files list...")
             self.__list_html_files()
 
+        self.__close_log_file()
+
+
+    def __make_dir(self,path):
+        """
+            Creates directory path if it does not exist, possibly created
+            at the same time by another shard
+        """
+
+        try:
+            os.mkdir(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+
+
+    def __close_log_file(self):
+        """
+            Writes the lexer rules profile of the scan and the hashes of the
+            scan in the store, and closes the log file, the report, the
+            tokens of the code duplications and the store
+        """
+
+        if not self.__shard:
+            self.__hash_store.set("file_hashes",self.__file_hashes)
+        self.__hash_store.commit()
+        self.__hash_store.close()
+        self.__report.close()
+        if self.__duplicate_finder is not None:
+            self.__duplicate_finder.close()
+
+        if self.__profile_lexer:
+            self.__log_file.write(datetime.datetime.now().strftime("%H:%M:%S")+" - Lexer rules profile of the scan\n"+rule_stats_table(self.__scan_rule_stats))
         self.__log_file.close()
 
+# StartDoors instance checking files in a --jobs worker process
+_worker = None
+
+def _init_worker(settings):
+    global _worker
+    _worker = StartDoors()
+    _worker._init_worker(settings)
+
+def _check_file(task):
+    i, dxl_file, data = task
+    return i, _worker._check_file(dxl_file,data)
+
+def _render_page(page):
+    return _worker._render_page(page)
+
 if __name__ == '__main__':
     """
         Description :
@@ -0,0 +1,87 @@
+#!/bin/env python
+
+# standard imports
+import sqlite3
+
+# Tables of the store, each one a value by path
+TABLES = ("include_hashes","page_keys","file_hashes")
+
+# Default number of seconds waiting for the store locked by another process
+TIMEOUT = 60
+
+# Minimum number of seconds between the modification of a file and its
+# hashing for its stamp to be kept: a file modified again within the
+# resolution of the modification times keeps the same stamp
+RACY_SECONDS = 2
+
+
+def file_stamp(st):
+    """
+        Returns the stamp of a file from its os.stat() result: its size,
+        modification time and id (inode, 0 on Windows), one of which
+        changes when the file is written
+    """
+
+    return "%d %r %d" % (st.st_size,st.st_mtime,st.st_ino)
+
+
+class HashStore:
+    """
+        Values by path of the previous scans, in tables of an SQLite
+        database: the content hashes of the includes, the keys of the
+        HTML versions up to date and the stamps and content hashes of the
+        files read
+
+        get() reads a single value from the index of its table, so that
+        the --jobs workers and the shards open the store rather than load
+        every value. Values set during the scan are written at once by
+        commit(), at the end of the scan: until then get() returns the
+        values of the previous scans whatever the order of the checks.
+    """
+
+    def __init__(self,db_file,timeout=TIMEOUT):
+        self.__connection = sqlite3.connect(db_file,timeout)
+        self.__connection.text_factory = str
+        with self.__connection:
+            for table in TABLES:
+                self.__connection.execute("CREATE TABLE IF NOT EXISTS %s (path TEXT PRIMARY KEY, value TEXT)" % table)
+
+        # table -> path -> value set and not committed yet
+        self.__pending = dict([(table,dict()) for table in TABLES])
+
+    def get(self,table,path):
+        """
+            Returns the value of path in table committed by the previous
+            scans, None if there is none
+        """
+
+        row = self.__connection.execute("SELECT value FROM %s WHERE path = ?" % table,(path,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def set(self,table,values_dict):
+        """
+            Sets the values of a dictionnary path -> value in table,
+            written by commit()
+        """
+
+        self.__pending[table].update(values_dict)
+
+    def commit(self):
+        """
+            Writes the values set since the last commit in one transaction
+        """
+
+        with self.__connection:
+            for table in TABLES:
+                self.__connection.executemany("INSERT OR REPLACE INTO %s (path, value) VALUES (?, ?)" % table,self.__pending[table].iteritems())
+        for table in TABLES:
+            self.__pending[table].clear()
+
+    def close(self):
+        """
+            Closes the store, values set and not committed are lost
+        """
+
+        self.__connection.close()
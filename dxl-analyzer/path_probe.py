@@ -0,0 +1,63 @@
+#!/bin/env python
+
+# standard imports
+import os
+from multiprocessing.pool import ThreadPool
+
+# Default number of threads testing paths
+THREADS = 16
+
+
+class PathProbe:
+    """
+        Tests whether paths exist in a pool of threads, so that the round
+        trips to network drives of the paths of a file overlap
+
+        Each path is tested once, the results are kept for the life of
+        the instance.
+    """
+
+    def __init__(self,threads=THREADS):
+        self.__threads = threads
+        self.__pool = None
+
+        # path -> True if it exists
+        self.__exists = dict()
+
+    def exists(self,paths):
+        """
+            Returns a dictionnary path -> True if the path exists for each
+            path of paths, testing concurrently the paths not tested yet
+        """
+
+        new_paths = [path for path in set(paths) if not path in self.__exists]
+
+        if len(new_paths) > 1:
+            if self.__pool is None:
+                self.__pool = ThreadPool(self.__threads)
+            results = self.__pool.map(os.path.exists,new_paths)
+        else:
+            results = [os.path.exists(path) for path in new_paths]
+        self.__exists.update(zip(new_paths,results))
+
+        return self.__exists
+
+    def first_existing(self,candidates_list):
+        """
+            Returns, for each list of candidate paths in priority order of
+            candidates_list, the first existing path or None
+            All the candidates are tested concurrently.
+        """
+
+        exists = self.exists([path for candidates in candidates_list for path in candidates])
+
+        found_list = []
+        for candidates in candidates_list:
+            found = None
+            for path in candidates:
+                if exists[path]:
+                    found = path
+                    break
+            found_list.append(found)
+
+        return found_list
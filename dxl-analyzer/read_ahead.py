@@ -0,0 +1,110 @@
+#!/bin/env python
+
+# standard imports
+import threading
+
+# Default number of reading threads
+THREADS = 4
+
+# Default maximum number of bytes read ahead of the consumer
+MAX_BYTES = 64*1024*1024
+
+
+class ReadAhead:
+    """
+        Iterates over (path, data) for each path, in order, while a pool
+        of threads reads the next files
+
+        At most depth files, and about max_bytes bytes, are read ahead of
+        the consumer, so that reading from network drives overlaps the
+        processing of the current file without holding the whole corpus.
+        data is None if the file could not be read, the consumer then
+        gets the error by opening it itself.
+    """
+
+    def __init__(self,paths,depth,max_bytes=MAX_BYTES,threads=THREADS):
+        self.__paths = list(paths)
+        self.__depth = max(depth,1)
+        self.__max_bytes = max_bytes
+
+        # index -> data of files read and not consumed yet
+        self.__contents = dict()
+        self.__nb_bytes = 0
+        self.__next_read = 0
+        self.__next_consumed = 0
+        self.__closed = False
+        self.__condition = threading.Condition()
+
+        self.__threads = []
+        for i in xrange(min(threads,self.__depth,len(self.__paths))):
+            thread = threading.Thread(target=self.__read_files)
+            thread.daemon = True
+            self.__threads.append(thread)
+
+    def __can_read(self):
+        """
+            True if the next file can be read without exceeding depth and
+            max_bytes (a file is always read when nothing is buffered)
+        """
+
+        if self.__next_read >= len(self.__paths):
+            return False
+        if self.__next_read >= self.__next_consumed+self.__depth:
+            return False
+        return self.__nb_bytes < self.__max_bytes or not self.__contents
+
+    def __read_files(self):
+        """
+            Reading thread: reads the next files while allowed
+        """
+
+        while True:
+            with self.__condition:
+                while not self.__closed and not self.__can_read():
+                    if self.__next_read >= len(self.__paths):
+                        return
+                    self.__condition.wait()
+                if self.__closed:
+                    return
+                index = self.__next_read
+                self.__next_read += 1
+
+            try:
+                with open(self.__paths[index],"rb") as f:
+                    data = f.read()
+            except (IOError,OSError):
+                data = None
+
+            with self.__condition:
+                self.__contents[index] = data
+                if data is not None:
+                    self.__nb_bytes += len(data)
+                self.__condition.notify_all()
+
+    def __iter__(self):
+        for thread in self.__threads:
+            thread.start()
+
+        try:
+            for index, path in enumerate(self.__paths):
+                with self.__condition:
+                    while not index in self.__contents:
+                        self.__condition.wait()
+                    data = self.__contents.pop(index)
+                    if data is not None:
+                        self.__nb_bytes -= len(data)
+                    self.__next_consumed = index+1
+                    self.__condition.notify_all()
+                yield path, data
+        finally:
+            self.close()
+
+    def close(self):
+        """
+            Stops the reading threads
+        """
+
+        with self.__condition:
+            self.__closed = True
+            self.__contents.clear()
+            self.__condition.notify_all()
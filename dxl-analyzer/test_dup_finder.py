@@ -0,0 +1,89 @@
+#!/bin/env python
+
+# standard imports
+import unittest
+
+# custom imports
+import dxl_bench
+import dup_finder
+from dxl_lexer import get_lexer
+
+# Code shared by the files of the tests
+BLOCK = dxl_bench.generate_dxl(2000,seed=3)
+
+
+def fingerprint(data):
+    """
+        Returns the dup_finder.Fingerprints of DXL content data
+    """
+
+    return dup_finder.fingerprint(get_lexer().analyse(data).tokens)
+
+
+def duplications(files):
+    """
+        Returns the (tokens, occurrences) of the duplications found in
+        the list of (path, DXL content) files, added in order
+    """
+
+    finder = dup_finder.DuplicateFinder()
+    for path, data in files:
+        finder.add(path,fingerprint(data))
+    duplications_list = [(d.tokens,d.occurrences) for d in finder.duplications()]
+    finder.close()
+    return duplications_list
+
+
+class TestDuplicateFinder(unittest.TestCase):
+
+    def test_code_differing_outside_the_fingerprints(self):
+        fingerprints = fingerprint("int q = 1\n"+BLOCK)
+        other_fingerprints = fingerprint("int q = 2\n"+BLOCK)
+        # the tokens that differ are in no window selected by winnowing
+        self.assertEqual(fingerprints.high_hashes,other_fingerprints.high_hashes)
+        self.assertEqual(fingerprints.low_hashes,other_fingerprints.low_hashes)
+        self.assertNotEqual(fingerprints.token_hashes,other_fingerprints.token_hashes)
+
+        self.assertNotEqual(fingerprints.digest(),other_fingerprints.digest())
+
+        finder = dup_finder.DuplicateFinder()
+        finder.add("a.dxl",fingerprints)
+        finder.add("b.dxl",other_fingerprints)
+        duplications = finder.duplications()
+        self.assertEqual(len(duplications),1)
+        self.assertEqual([path for path, first_line, last_line in duplications[0].occurrences],["a.dxl","b.dxl"])
+        finder.close()
+
+    def test_code_differing_by_comments_and_layout(self):
+        fingerprints = fingerprint("int q = 1\n"+BLOCK)
+        other_fingerprints = fingerprint("// same code\nint  q  =  1\n"+BLOCK)
+        self.assertEqual(fingerprints.digest(),other_fingerprints.digest())
+
+        # the whole file is duplicated, on the lines of each file
+        nb_tokens = len(fingerprints.token_hashes)
+        nb_lines = fingerprints.token_lines[-1]
+        finder = dup_finder.DuplicateFinder()
+        finder.add("a.dxl",fingerprints)
+        finder.add("b.dxl",other_fingerprints)
+        self.assertEqual([(d.tokens,d.occurrences) for d in finder.duplications()],[(nb_tokens,[("a.dxl",1,nb_lines),("b.dxl",2,nb_lines+1)])])
+        finder.close()
+
+    def test_duplications_of_files_with_the_same_code(self):
+        files = [("a.dxl","int q = 1\n"+BLOCK),("b.dxl","// same code\nint  q  =  1\n"+BLOCK),("c.dxl","int r = 3\n"+BLOCK)]
+        found = duplications(files)
+        self.assertEqual([[path for path, first_line, last_line in occurrences] for tokens, occurrences in found],[["a.dxl","b.dxl"],["a.dxl","b.dxl","c.dxl"]])
+        # b.dxl has one more line than a.dxl
+        a_occurrence, b_occurrence, c_occurrence = found[1][1]
+        self.assertEqual((b_occurrence[1],b_occurrence[2]),(a_occurrence[1]+1,a_occurrence[2]+1))
+
+    def test_order_of_the_files(self):
+        files = [("a.dxl","int q = 1\n"+BLOCK),("b.dxl","// same code\nint  q  =  1\n"+BLOCK),
+                 ("c.dxl","int r = 3\n"+BLOCK[:len(BLOCK)/2]),("d.dxl",BLOCK[len(BLOCK)/3:]+BLOCK[len(BLOCK)/3:])]
+        found = duplications(files)
+        self.assertTrue(len(found) > 2)
+        for order in [[3,2,1,0],[1,3,0,2],[2,0,3,1]]:
+            self.assertEqual(duplications([files[i] for i in order]),found,order)
+
+
+if __name__ == '__main__':
+    unittest.main()
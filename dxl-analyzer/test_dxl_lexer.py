@@ -0,0 +1,214 @@
+#!/bin/env python
+
+# standard imports
+import os
+import random
+import tempfile
+import unittest
+
+# custom imports
+import dxl_bench
+import dxl_lexer
+from dxl_lexer import get_lexer,token_stream
+
+# Seeds of the generated DXL files
+SEEDS = range(5)
+
+# Size in bytes of the generated DXL files
+SIZE = 32*1024
+
+
+# Inputs where the rules of the linear mode and of the scanner engine
+# differ most from the regex of ply
+EDGE_CASES = {
+    "empty": "",
+    "long line": "x = " + "f(a) + " * 3000 + "0\n",
+    "worst case line": dxl_bench.worst_case_line(300),
+    "array definitions split across lines": "int a[] = \n{1,2,3}\nint b[]\n= {4}\nint c[\n] = {5}\nint d[]  =  {6}\n",
+    "nested parentheses": "x = f(g(h(i(j(1,2),k(3)),(4+(5*(6)))),l)\nvoid f(int a, string g(int)) {\n    return\n}\n",
+    "unterminated string": "string s = \"abc\nint x = 1\n",
+    "unterminated string at end": "string s = \"abc",
+    "unterminated comment": "int x = 1 /* comment\nint y = 2\n",
+    "unterminated comment at end": "int x = 1 /* comment",
+    "comment at end": "int x // end",
+    "windows line endings": "int a = 1\r\nstring s = \"x\"\r\n#include <lib/a.inc>\r\n",
+    "includes and pragmas": "#include <lib/a.inc>\n#include \"b.inc\"\npragma runLim, 0\n",
+}
+
+
+# Sizes of the windows of Lexer.analyse_file() in the tests, small enough
+# for the windows to end in comments, strings and long lines
+CHUNK_SIZES = (64,257,1024)
+
+# Inputs whose tokens are longer than the windows of Lexer.analyse_file()
+CHUNK_CASES = {
+    "block comments": "int a = 1\n/*\n" + "comment line\n" * 60 + "*/\nint b = 2\n/* " + "x " * 400 + "*/\nint c = 3\n",
+    "strings": "string s = \"" + "text " * 200 + "\"\nstring t = \"first line\n" + "next line\n" * 40 + "\"\nint d = 4\n",
+    "long lines": ("x = " + "f(a) + " * 200 + "0\n") * 5,
+    "includes": "#include <lib/" + "d/" * 50 + "a.inc>\n" * 20,
+}
+
+
+def corpus():
+    """
+        Returns a list of (name, DXL content) of the edge cases and of
+        DXL files generated by dxl_bench
+    """
+
+    cases = sorted(EDGE_CASES.items())
+    for seed in SEEDS:
+        cases.append(("generated %d" % seed,dxl_bench.generate_dxl(SIZE,seed=seed)))
+    return cases
+
+
+class TestLinearLexing(unittest.TestCase):
+    """
+        The linear mode gives the tokens of the regex rules
+    """
+
+    def test_same_tokens(self):
+        default_lexer = get_lexer()
+        linear_lexer = get_lexer(linear=True)
+        for name, data in corpus():
+            self.assertEqual(token_stream(default_lexer,data),token_stream(linear_lexer,data),name)
+
+
+class TestScanner(unittest.TestCase):
+    """
+        The scanner engine gives the tokens of ply, in default and linear
+        modes
+    """
+
+    def check_same_tokens(self,linear):
+        ply_lexer = get_lexer(linear=linear)
+        scanner_lexer = get_lexer(linear=linear,scanner=True)
+        for name, data in corpus():
+            self.assertEqual(token_stream(ply_lexer,data),token_stream(scanner_lexer,data),name)
+
+    def test_same_tokens(self):
+        self.check_same_tokens(False)
+
+    def test_same_tokens_linear(self):
+        self.check_same_tokens(True)
+
+
+# Number of random edits of each input of the edit tests
+NB_EDITS = 10
+
+# Texts inserted by the edit tests
+EDIT_TEXTS = ("","x","\n","\n\n","/* ","*/","\"","// c\n","f(",")","[] = {","int y = 2\n","#include <a.inc>\n")
+
+
+def analysis_state(analysis):
+    """
+        Returns what the checks and the rendering use of a Lexer.Analysis
+    """
+
+    state = dict(vars(analysis))
+    tokens = state.pop("tokens")
+    for name in ["types","starts","ends","lines","columns","line_index"]:
+        state[name] = list(getattr(tokens,name))
+    return state
+
+
+def tok_dict_state(tok_dict):
+    """
+        Returns the (value, type, line, column) of the tokens of each line
+        of a tok_dict of Lexer.init()
+    """
+
+    return dict([(l,[(t.value,t.type,t.line,t.column) for t in toks]) for l, toks in tok_dict.items()])
+
+
+def edits(data,rand):
+    """
+        Returns a list of (start, end, text) edits of data: at the start
+        and at the end of data, in its comments and strings, across lines
+        and anywhere
+    """
+
+    positions = [0,len(data)]
+    for mark in ["/*","*/","//","\"","\n"]:
+        k = data.find(mark)
+        while k != -1 and len(positions) < 200:
+            positions.append(k)
+            k = data.find(mark,k+1)
+
+    edits_list = [(0,0,"int z = 0\n"),(len(data),len(data),"\nint z = 0")]
+    if data:
+        edits_list.append((0,1,""))
+        edits_list.append((len(data)-1,len(data),""))
+    while len(edits_list) < NB_EDITS:
+        start = rand.choice(positions)+rand.randint(-2,2)
+        start = min(max(start,0),len(data))
+        # up to across a few lines
+        end = min(start+rand.choice([0,1,3,30,200]),len(data))
+        edits_list.append((start,end,rand.choice(EDIT_TEXTS)))
+    return edits_list
+
+
+class TestEdit(unittest.TestCase):
+    """
+        Lexer.edit() after Lexer.init() gives the tokens of init() of the
+        edited content
+    """
+
+    def check_same_tokens(self,linear):
+        rand = random.Random(0)
+        lexer = get_lexer(linear=linear)
+        fresh_lexer = get_lexer(linear=linear)
+        for name, data in corpus():
+            for start, end, text in edits(data,rand):
+                lexer.init(data)
+                new_data = data[:start]+text+data[end:]
+                tok_dict = lexer.edit(start,end,text)
+                message = "%s, %r replacing %d:%d" % (name,text,start,end)
+                self.assertEqual(tok_dict_state(tok_dict),tok_dict_state(fresh_lexer.init(new_data)),message)
+
+                # further edits start from the edited tokens
+                tok_dict = lexer.edit(0,0,"\n")
+                self.assertEqual(tok_dict_state(tok_dict),tok_dict_state(fresh_lexer.init("\n"+new_data)),message+", then a new first line")
+
+    def test_same_tokens(self):
+        self.check_same_tokens(False)
+
+    def test_same_tokens_linear(self):
+        self.check_same_tokens(True)
+
+
+class TestChunkedLexing(unittest.TestCase):
+    """
+        Lexer.analyse_file() lexing by windows gives the analysis of the
+        whole content by Lexer.analyse()
+    """
+
+    def setUp(self):
+        self.chunk_size = dxl_lexer.CHUNK_SIZE
+        handle, self.dxl_file = tempfile.mkstemp(".dxl")
+        os.close(handle)
+
+    def tearDown(self):
+        dxl_lexer.CHUNK_SIZE = self.chunk_size
+        os.remove(self.dxl_file)
+
+    def check_same_analysis(self,linear):
+        lexer = get_lexer(linear=linear)
+        for name, data in corpus()+sorted(CHUNK_CASES.items()):
+            with open(self.dxl_file,"wb") as f:
+                f.write(data)
+            expected = analysis_state(lexer.analyse(data))
+            for chunk_size in CHUNK_SIZES:
+                dxl_lexer.CHUNK_SIZE = chunk_size
+                analysis = lexer.analyse_file(self.dxl_file)
+                self.assertEqual(analysis_state(analysis),expected,"%s, %d bytes windows" % (name,chunk_size))
+                analysis.tokens.close()
+
+    def test_same_analysis(self):
+        self.check_same_analysis(False)
+
+    def test_same_analysis_linear(self):
+        self.check_same_analysis(True)
+
+
+if __name__ == '__main__':
+    unittest.main()